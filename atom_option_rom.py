@@ -0,0 +1,163 @@
+import optparse
+import sys
+import struct
+from atom_rom import map_bios, bios_bytes_sum, get_bios_byte, atom_rom_header_ptr, atom_rom_size_offset, atom_rom_checksum_offset
+from atom_timings_editor import BiosImage
+from atom_timings_validate import format_violation
+
+#option rom images (0x55aa with a PCI data structure) inside flash dumps or chained legacy and uefi roms,
+#dumps are searched and checked in place, only the atom images that get patched are copied
+
+option_rom_align=512
+option_rom_code_types={0: 'x86', 1: 'openfirmware', 2: 'hp-pa', 3: 'efi'}
+
+def read_option_rom(data, offset):
+  #image at offset as dict or None if there is no valid one
+  if offset+0x1a>len(data) or data[offset:offset+2]!='\x55\xaa':
+    return None
+  pcir_offset=offset+struct.unpack_from('<H', data, offset+0x18)[0]
+  if pcir_offset+0x18>len(data) or data[pcir_offset:pcir_offset+4]!='PCIR':
+    return None
+  vendor_id, device_id=struct.unpack_from('<HH', data, pcir_offset+4)
+  length=struct.unpack_from('<H', data, pcir_offset+0x10)[0]*512
+  code_type, indicator=struct.unpack_from('<BB', data, pcir_offset+0x14)
+  if length==0 or offset+length>len(data):
+    return None
+
+  image={'offset': offset, 'length': length, 'vendor_id': vendor_id, 'device_id': device_id, 'code_type': code_type, 'last': bool(indicator & 0x80), 'atom': False, 'checksum_ok': None}
+  if code_type==0:
+    atom_rom_header_offset=struct.unpack_from('<H', data, offset+atom_rom_header_ptr)[0]
+    size=get_bios_byte(data, offset+atom_rom_size_offset)*512
+    if atom_rom_header_offset+8<=length and data[offset+atom_rom_header_offset+4:offset+atom_rom_header_offset+8]=='ATOM' and 0<size<=length:
+      image['atom']=True
+      image['checksum_ok']=bios_bytes_sum(data, offset, offset+size) % 256==0
+  return image
+
+def find_option_roms(data, start=0):
+  """Option rom images on 512 byte boundaries of a bytearray or mmap, in order"""
+  images=[]
+  pos=start
+  while True:
+    i=data.find('\x55\xaa', pos)
+    if i==-1:
+      break
+    if i % option_rom_align:
+      pos=i-i % option_rom_align+option_rom_align #only aligned images count, skip to the next boundary
+      continue
+    image=read_option_rom(data, i)
+    if image is None:
+      pos=i+option_rom_align
+      continue
+    images+=[image]
+    pos=i+image['length'] #chained images follow directly
+  return images
+
+def write_changed_blocks(data, offset, old, new, block_size=256):
+  #copy the blocks of new that differ from old to data at offset, returns number of bytes written
+  written=0
+  for i in xrange(0, len(new), block_size):
+    block=new[i:i+block_size]
+    if block!=old[i:i+block_size]:
+      data[offset+i:offset+i+len(block)]=bytes(block)
+      written+=len(block)
+  return written
+
+def fix_option_rom_checksum(data, image):
+  #checksum of one atom image of the dump, the image is summed in place and only its checksum byte changes
+  size=get_bios_byte(data, image['offset']+atom_rom_size_offset)*512
+  offset=bios_bytes_sum(data, image['offset'], image['offset']+size)
+  checksum=(get_bios_byte(data, image['offset']+atom_rom_checksum_offset)-offset) % 256
+  data[image['offset']+atom_rom_checksum_offset:image['offset']+atom_rom_checksum_offset+1]=chr(checksum)
+
+def patch_option_rom(data, image, patches, **kwargs):
+  """Patched copy of one atom image of a dump as (BiosImage, timing rule violations), nothing is written to the dump"""
+  offset, length=image['offset'], image['length']
+  bios_image=BiosImage(bytearray(data[offset:offset+length]), **kwargs)
+  if bios_image.timing_entry_type not in ['R9', 'RX']:
+    sys.exit('Image at 0x%x: could not detect timing entry type' % offset)
+  if bios_image.timing_table_length==0:
+    sys.exit('Image at 0x%x: could not find timing table' % offset)
+  bios_image.patch(patches)
+  return bios_image, bios_image.validate()
+
+def write_option_rom(data, image, bios_image):
+  """Write a patched image back to a writable dump, returns number of bytes written"""
+  return write_changed_blocks(data, image['offset'], bios_image.bios, bios_image.serialize())
+
+def save_option_rom_list(f, images):
+  for n, i in enumerate(images):
+    print >>f, "%d 0x%08x %7d %04x:%04x %-12s %s %s %s" % (n, i['offset'], i['length'], i['vendor_id'], i['device_id'], option_rom_code_types.get(i['code_type'], str(i['code_type'])), 'atom' if i['atom'] else '-', {True: 'checksum-ok', False: 'checksum-bad', None: '-'}[i['checksum_ok']], 'last' if i['last'] else '-')
+
+if __name__ == '__main__':
+  parser = optparse.OptionParser(usage="%prog [options] -i <dump>")
+  parser.add_option("-i", "--input", dest="input", help="Flash dump or rom file")
+  parser.add_option("-o", "--output", dest="output", help="Output file (may be the input), only changed blocks of atom images are written")
+  parser.add_option("-n", "--image", dest="image", action="append", help="Number of the image to patch or extract (default all atom images)")
+  parser.add_option("-x", "--extract", dest="extract", default=None, help="Write atom images to <prefix>_<offset>.rom")
+  parser.add_option("-p", "--patch", dest="patch", action="append", help="Patch for atom images, same syntax as atom_timings_editor.py")
+  parser.add_option("--fix-checksums", dest="fix_checksums", action="store_true", default=False, help="Fix checksums of all atom images")
+  parser.add_option("--force", dest="force", action="store_true", default=False, help="Write patched timings even if they break timing rules")
+  parser.add_option("--offset", dest="timing_table_offset", default=None, help="Timing table offset in bios relative to vram_info_table_offset+usMemClkPatchTblOffset+44 (default autodetect)")
+  parser.add_option("--length", dest="timing_table_length", default=None, help="Number of timings entries in bios to read (default autodetect)")
+  parser.add_option("--elength", dest="timing_entry_length", default=None, help="Lenght of timing string (default autodetect)")
+  parser.add_option("--type", dest="timing_entry_type", default=None, help="Type of timing entriy to decode (default autodetect)")
+
+  (options, args) = parser.parse_args()
+  if options.input is None:
+    parser.error("Option 'input' is required")
+  if (options.patch or options.fix_checksums) and options.output is None:
+    parser.error("Option 'output' is required to patch or fix checksums")
+
+  if options.output is not None:
+    data=map_bios(options.input, options.output)
+  else:
+    data=map_bios(options.input)
+  try:
+    images=find_option_roms(data)
+    save_option_rom_list(sys.stdout, images)
+
+    selected=[i for i in images if i['atom']]
+    if options.image:
+      selected=[]
+      for n in options.image:
+        if not n.isdigit() or int(n)>=len(images):
+          sys.exit('No image %s, the file has %d images' % (n, len(images)))
+        selected+=[images[int(n)]]
+    for image in selected:
+      if not image['atom']:
+        sys.exit('Image at 0x%x is not an atom bios' % image['offset'])
+
+    if options.extract is not None:
+      for image in selected:
+        with open('%s_%08x.rom' % (options.extract, image['offset']), 'wb') as image_file:
+          image_file.write(data[image['offset']:image['offset']+image['length']])
+
+    if options.patch:
+      #every image is patched and checked before the first one is written, a rejected image leaves the dump unchanged
+      patched=[]
+      violations=0
+      for image in selected:
+        bios_image, image_violations=patch_option_rom(data, image, options.patch,
+          timing_entry_type=options.timing_entry_type,
+          timing_entry_length=int(options.timing_entry_length) if options.timing_entry_length is not None else None,
+          timing_table_offset=int(options.timing_table_offset) if options.timing_table_offset is not None else None,
+          timing_table_length=int(options.timing_table_length) if options.timing_table_length is not None else None)
+        for v in image_violations:
+          print >>sys.stderr, 'Image at 0x%x: %s' % (image['offset'], format_violation(v))
+        violations+=len(image_violations)
+        patched+=[(image, bios_image)]
+      if violations and not options.force:
+        sys.exit('%d timing rule violations, use --force to write anyway' % violations)
+      for image, bios_image in patched:
+        written=write_option_rom(data, image, bios_image)
+        print >>sys.stderr, "Image at 0x%x: %d bytes written" % (image['offset'], written)
+
+    if options.fix_checksums:
+      for image in images:
+        if image['atom']:
+          fix_option_rom_checksum(data, image)
+
+    if options.output is not None:
+      data.flush()
+  finally:
+    data.close()
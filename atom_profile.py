@@ -0,0 +1,102 @@
+import time
+import json
+import atom_rom_timings
+
+#per bios timers and counters, everything takes stats=None to mean switched off
+
+class Stats(object):
+  """Exclusive wall time and calls per phase plus plain counters for one bios"""
+
+  def __init__(self, **info):
+    self.info=info
+    self.phases={}
+    self.counters={}
+    self.stack=[]
+    self.start=time.time()
+    cache=atom_rom_timings.register_cache
+    self.cache_start=(cache.hits, cache.misses)
+
+  def phase(self, name):
+    return StatsPhase(self, name)
+
+  def count(self, name, n=1):
+    self.counters[name]=self.counters.get(name, 0)+n
+
+  def record(self):
+    r=dict(self.info)
+    r['total_seconds']=time.time()-self.start
+    r['phases']=dict((name, {'seconds': s, 'calls': c}) for name, (s, c) in self.phases.items())
+    r['counters']=dict(self.counters)
+    cache=atom_rom_timings.register_cache
+    r['counters']['register_cache_hits']=cache.hits-self.cache_start[0]
+    r['counters']['register_cache_misses']=cache.misses-self.cache_start[1]
+    return r
+
+  def save(self, f):
+    print >>f, json.dumps(self.record(), sort_keys=True)
+
+class StatsPhase(object):
+  #time of nested phases is only counted in the innermost one
+  def __init__(self, stats, name):
+    self.stats=stats
+    self.name=name
+
+  def __enter__(self):
+    self.children=0.0
+    self.stats.stack.append(self)
+    self.begin=time.time()
+
+  def __exit__(self, *exc):
+    elapsed=time.time()-self.begin
+    stack=self.stats.stack
+    stack.pop()
+    if stack:
+      stack[-1].children+=elapsed
+    s, c=self.stats.phases.get(self.name, (0.0, 0))
+    self.stats.phases[self.name]=(s+elapsed-self.children, c+1)
+
+class NullPhase(object):
+  def __enter__(self):
+    pass
+
+  def __exit__(self, *exc):
+    pass
+
+null_phase=NullPhase()
+
+def phase(stats, name):
+  if stats is None:
+    return null_phase
+  return stats.phase(name)
+
+def count(stats, name, n=1):
+  if stats is not None:
+    stats.count(name, n)
+
+#stats the instrumented register codec reports to
+active_stats=None
+
+def instrument(module, name, phase_name):
+  f=getattr(module, name)
+  if getattr(f, 'instrumented', False):
+    return
+  def instrumented(*args, **kwargs):
+    if active_stats is None:
+      return f(*args, **kwargs)
+    with active_stats.phase(phase_name):
+      return f(*args, **kwargs)
+  instrumented.instrumented=True
+  instrumented.__name__=f.__name__
+  setattr(module, name, instrumented)
+
+def instrument_registers():
+  #only replaced when profiling is asked for, so the codec runs untouched otherwise
+  instrument(atom_rom_timings, 'decode_register', 'register_decode')
+  instrument(atom_rom_timings, 'get_subregister', 'register_decode')
+  instrument(atom_rom_timings, 'set_subregister', 'register_encode')
+
+def set_active_stats(stats):
+  global active_stats
+  if stats is not None:
+    instrument_registers()
+  active_stats=stats
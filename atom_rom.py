@@ -1,29 +1,87 @@
 import optparse
 import sys
 import re
-from construct import *
+import os
+import shutil
+import mmap
+import struct
+import zlib
+import collections
 
 atom_rom_checksum_offset = 0x21
 atom_rom_size_offset=0x2
 atom_rom_header_ptr = 0x48
 
+#bios is a bytearray or a mmap, indexing mmap gives strings so single bytes go through these
+
+def get_bios_byte(bios, offset):
+  return struct.unpack_from('<B', bios, offset)[0]
+
+def set_bios_byte(bios, offset, value):
+  bios[offset:offset+1]=chr(value)
+
+def load_bios(path):
+  with open(path, 'rb') as bios_file:
+    return bytearray(bios_file.read())
+
+def map_bios(path, output_path=None):
+  #read only map of path, or a writable map of output_path holding a copy of path
+  if output_path is None:
+    with open(path, 'rb') as bios_file:
+      return mmap.mmap(bios_file.fileno(), 0, access=mmap.ACCESS_READ)
+  if not os.path.exists(output_path) or not os.path.samefile(path, output_path):
+    shutil.copyfile(path, output_path)
+  with open(output_path, 'r+b') as bios_file:
+    return mmap.mmap(bios_file.fileno(), 0, access=mmap.ACCESS_WRITE)
+
+def bios_bytes_sum(bios, start=0, end=None):
+  #low half of adler32 is the plain byte sum modulo 65521, it can not wrap for 256 bytes
+  if end is None:
+    end=len(bios)
+  s=0
+  for i in xrange(start, end, 256):
+    s+=zlib.adler32(buffer(bios, i, min(256, end-i)), 0) & 0xffff
+  return s
+
+def get_bios_size(bios):
+  size=get_bios_byte(bios, atom_rom_size_offset)*512
+  if size>len(bios):
+    sys.exit('Bios size %d in header is bigger than bios' % size)
+  return size
+
+def verify_bios_checksum(bios):
+  return bios_bytes_sum(bios, 0, get_bios_size(bios)) % 256==0
+
 def fix_bios_checksum(bios, verbose=False):
-  size=bios[atom_rom_size_offset]*512
-  checksum=bios[atom_rom_checksum_offset]
+  size=get_bios_size(bios)
+  checksum=get_bios_byte(bios, atom_rom_checksum_offset)
 
   if verbose:
     print "Size %d, checksum %d" % (size, checksum)
 
-  offset=0
-  for i in xrange(0,size):
-    offset += bios[i]
+  offset=bios_bytes_sum(bios, 0, size)
 
   if verbose:
     print "New checksum difference %d" % (offset % 256)
 
   checksum-=offset
   checksum%=256
-  bios[atom_rom_checksum_offset]=checksum
+  set_bios_byte(bios, atom_rom_checksum_offset, checksum)
+
+def write_bios_range(bios, offset, data):
+  #write data and adjust the checksum by the byte delta of the range instead of summing the whole image
+  end=offset+len(data)
+  if offset<=atom_rom_size_offset<end or offset<=atom_rom_checksum_offset<end:
+    bios[offset:end]=bytes(data)
+    fix_bios_checksum(bios)
+    return
+  size=get_bios_size(bios)
+  delta=0
+  if offset<size:
+    delta-=sum(bytearray(bios[offset:min(end, size)]))
+    delta+=sum(bytearray(data[0:min(end, size)-offset]))
+  bios[offset:end]=bytes(data)
+  set_bios_byte(bios, atom_rom_checksum_offset, (get_bios_byte(bios, atom_rom_checksum_offset)-delta) % 256)
 
 def get_bios_version(bios):
     bios_=bios[0:1024]
@@ -35,126 +93,188 @@ def get_bios_version(bios):
 
     return bios_[version_offset+7:version_offset+30]
 
-ATOM_COMMON_TABLE_HEADER=Struct("ATOM_COMMON_TABLE_HEADER",
-  ULInt16("usStructureSize"),
-  ULInt8("ucTableFormatRevision"),
-  ULInt8("ucTableContentRevision")
+#structures are precompiled struct formats, the only definition of their fields; construct (slow to import)
+#Structs are generated from them by construct_struct for construct parse/build
+
+class CompiledStruct(object):
+  """Fixed size little endian structure, fields are (name, struct format) or (name, CompiledStruct)"""
+
+  def __init__(self, name, *fields):
+    self.name=name
+    self.fields=fields
+    fmt=''
+    self.layout=[]
+    for f_name, f in fields:
+      if isinstance(f, CompiledStruct):
+        fmt+=f.packer.format[1:]
+        self.layout+=[(f_name, f.layout)]
+      else:
+        fmt+=f
+        self.layout+=[(f_name, None)]
+    self.packer=struct.Struct('<'+fmt)
+
+  def sizeof(self):
+    return self.packer.size
+
+class Container(collections.OrderedDict):
+  """Parsed structure with fields as attributes, printed like construct's Container"""
+
+  def __getattr__(self, name):
+    try:
+      return self[name]
+    except KeyError:
+      raise AttributeError(name)
+
+  def __str__(self, nesting=1):
+    lines=['Container:']
+    for k, v in self.items():
+      lines+=['    '*nesting+k+' = '+(v.__str__(nesting+1) if isinstance(v, Container) else repr(v))]
+    return '\n'.join(lines)
+
+ATOM_COMMON_TABLE_HEADER=CompiledStruct("ATOM_COMMON_TABLE_HEADER",
+  ("usStructureSize", 'H'),
+  ("ucTableFormatRevision", 'B'),
+  ("ucTableContentRevision", 'B')
 )
 
 #FIXME this is different from atombios.h version and probably wrong after ucReserved
-ATOM_ROM_HEADER=Struct("ATOM_ROM_HEADER",
-  Rename("sHeader", ATOM_COMMON_TABLE_HEADER),
-  ULInt32("uaFirmWareSignature"),
-  ULInt16("usBiosRuntimeSegmentAddress"),
-  ULInt16("usProtectedModeInfoOffset"),
-  ULInt16("usConfigFilenameOffset"),
-  ULInt16("usCRC_BlockOffset"),
-  ULInt16("usBIOS_BootupMessageOffset"),
-  ULInt16("usInt10Offset"),
-  ULInt16("usPciBusDevInitCode"),
-  ULInt16("usIoBaseAddress"),
-  ULInt16("usSubsystemVendorID"),
-  ULInt16("usSubsystemID"),
-  ULInt16("usPCI_InfoOffset"),
-  ULInt16("usMasterCommandTableOffset"),
-  ULInt16("usMasterDataTableOffset"),
-  ULInt8("ucExtendedFunctionCode"),
-  ULInt8("ucReserved"),
-  ULInt32("ulPSPDirTableOffset"),
-  ULInt16("usVendorID"),
-  ULInt16("usDeviceID")
+ATOM_ROM_HEADER=CompiledStruct("ATOM_ROM_HEADER",
+  ("sHeader", ATOM_COMMON_TABLE_HEADER),
+  ("uaFirmWareSignature", 'I'),
+  ("usBiosRuntimeSegmentAddress", 'H'),
+  ("usProtectedModeInfoOffset", 'H'),
+  ("usConfigFilenameOffset", 'H'),
+  ("usCRC_BlockOffset", 'H'),
+  ("usBIOS_BootupMessageOffset", 'H'),
+  ("usInt10Offset", 'H'),
+  ("usPciBusDevInitCode", 'H'),
+  ("usIoBaseAddress", 'H'),
+  ("usSubsystemVendorID", 'H'),
+  ("usSubsystemID", 'H'),
+  ("usPCI_InfoOffset", 'H'),
+  ("usMasterCommandTableOffset", 'H'),
+  ("usMasterDataTableOffset", 'H'),
+  ("ucExtendedFunctionCode", 'B'),
+  ("ucReserved", 'B'),
+  ("ulPSPDirTableOffset", 'I'),
+  ("usVendorID", 'H'),
+  ("usDeviceID", 'H')
 )
 
-ATOM_MASTER_DATA_TABLE=Struct("ATOM_MASTER_DATA_TABLE",
-  Rename("sHeader", ATOM_COMMON_TABLE_HEADER),
-  ULInt16("UtilityPipeLine"),          # Offest for the utility to get parser info,Don't change this position!
-  ULInt16("MultimediaCapabilityInfo"), # Only used by MM Lib,latest version 1.1, not configuable from Bios, need to include the table to build Bios
-  ULInt16("MultimediaConfigInfo"),     # Only used by MM Lib,latest version 2.1, not configuable from Bios, need to include the table to build Bios
-  ULInt16("StandardVESA_Timing"),      # Only used by Bios
-  ULInt16("FirmwareInfo"),             # Shared by various SW components,latest version 1.4
-  ULInt16("PaletteData"),              # Only used by BIOS
-  ULInt16("LCD_Info"),                 # Shared by various SW components,latest version 1.3, was called LVDS_Info
-  ULInt16("DIGTransmitterInfo"),       # Internal used by VBIOS only version 3.1
-  ULInt16("SMU_Info"),                 # Shared by various SW components,latest version 1.1
-  ULInt16("SupportedDevicesInfo"),     # Will be obsolete from R600
-  ULInt16("GPIO_I2C_Info"),            # Shared by various SW components,latest version 1.2 will be used from R600
-  ULInt16("VRAM_UsageByFirmware"),     # Shared by various SW components,latest version 1.3 will be used from R600
-  ULInt16("GPIO_Pin_LUT"),             # Shared by various SW components,latest version 1.1
-  ULInt16("VESA_ToInternalModeLUT"),   # Only used by Bios
-  ULInt16("GFX_Info"),                 # Shared by various SW components,latest version 2.1 will be used from R600
-  ULInt16("PowerPlayInfo"),            # Shared by various SW components,latest version 2.1,new design from R600
-  ULInt16("GPUVirtualizationInfo"),    # Will be obsolete from R600
-  ULInt16("SaveRestoreInfo"),          # Only used by Bios
-  ULInt16("PPLL_SS_Info"),             # Shared by various SW components,latest version 1.2, used to call SS_Info, change to new name because of int ASIC SS info
-  ULInt16("OemInfo"),                  # Defined and used by external SW, should be obsolete soon
-  ULInt16("XTMDS_Info"),               # Will be obsolete from R600
-  ULInt16("MclkSS_Info"),              # Shared by various SW components,latest version 1.1, only enabled when ext SS chip is used
-  ULInt16("Object_Header"),            # Shared by various SW components,latest version 1.1
-  ULInt16("IndirectIOAccess"),         # Only used by Bios,this table position can't change at all!!
-  ULInt16("MC_InitParameter"),         # Only used by command table
-  ULInt16("ASIC_VDDC_Info"),           # Will be obsolete from R600
-  ULInt16("ASIC_InternalSS_Info"),     # New tabel name from R600, used to be called "ASIC_MVDDC_Info"
-  ULInt16("TV_VideoMode"),             # Only used by command table
-  ULInt16("VRAM_Info"),                # Only used by command table, latest version 1.3
-  ULInt16("MemoryTrainingInfo"),       # Used for VBIOS and Diag utility for memory training purpose since R600. the new table rev start from 2.1
-  ULInt16("IntegratedSystemInfo"),     # Shared by various SW components
-  ULInt16("ASIC_ProfilingInfo"),       # New table name from R600, used to be called "ASIC_VDDCI_Info" for pre-R600
-  ULInt16("VoltageObjectInfo"),        # Shared by various SW components, latest version 1.1
-  ULInt16("PowerSourceInfo"),          # Shared by various SW components, latest versoin 1.1
-  ULInt16("ServiceInfo"),
+ATOM_MASTER_DATA_TABLE=CompiledStruct("ATOM_MASTER_DATA_TABLE",
+  ("sHeader", ATOM_COMMON_TABLE_HEADER),
+  ("UtilityPipeLine", 'H'),          # Offest for the utility to get parser info,Don't change this position!
+  ("MultimediaCapabilityInfo", 'H'), # Only used by MM Lib,latest version 1.1, not configuable from Bios, need to include the table to build Bios
+  ("MultimediaConfigInfo", 'H'),     # Only used by MM Lib,latest version 2.1, not configuable from Bios, need to include the table to build Bios
+  ("StandardVESA_Timing", 'H'),      # Only used by Bios
+  ("FirmwareInfo", 'H'),             # Shared by various SW components,latest version 1.4
+  ("PaletteData", 'H'),              # Only used by BIOS
+  ("LCD_Info", 'H'),                 # Shared by various SW components,latest version 1.3, was called LVDS_Info
+  ("DIGTransmitterInfo", 'H'),       # Internal used by VBIOS only version 3.1
+  ("SMU_Info", 'H'),                 # Shared by various SW components,latest version 1.1
+  ("SupportedDevicesInfo", 'H'),     # Will be obsolete from R600
+  ("GPIO_I2C_Info", 'H'),            # Shared by various SW components,latest version 1.2 will be used from R600
+  ("VRAM_UsageByFirmware", 'H'),     # Shared by various SW components,latest version 1.3 will be used from R600
+  ("GPIO_Pin_LUT", 'H'),             # Shared by various SW components,latest version 1.1
+  ("VESA_ToInternalModeLUT", 'H'),   # Only used by Bios
+  ("GFX_Info", 'H'),                 # Shared by various SW components,latest version 2.1 will be used from R600
+  ("PowerPlayInfo", 'H'),            # Shared by various SW components,latest version 2.1,new design from R600
+  ("GPUVirtualizationInfo", 'H'),    # Will be obsolete from R600
+  ("SaveRestoreInfo", 'H'),          # Only used by Bios
+  ("PPLL_SS_Info", 'H'),             # Shared by various SW components,latest version 1.2, used to call SS_Info, change to new name because of int ASIC SS info
+  ("OemInfo", 'H'),                  # Defined and used by external SW, should be obsolete soon
+  ("XTMDS_Info", 'H'),               # Will be obsolete from R600
+  ("MclkSS_Info", 'H'),              # Shared by various SW components,latest version 1.1, only enabled when ext SS chip is used
+  ("Object_Header", 'H'),            # Shared by various SW components,latest version 1.1
+  ("IndirectIOAccess", 'H'),         # Only used by Bios,this table position can't change at all!!
+  ("MC_InitParameter", 'H'),         # Only used by command table
+  ("ASIC_VDDC_Info", 'H'),           # Will be obsolete from R600
+  ("ASIC_InternalSS_Info", 'H'),     # New tabel name from R600, used to be called "ASIC_MVDDC_Info"
+  ("TV_VideoMode", 'H'),             # Only used by command table
+  ("VRAM_Info", 'H'),                # Only used by command table, latest version 1.3
+  ("MemoryTrainingInfo", 'H'),       # Used for VBIOS and Diag utility for memory training purpose since R600. the new table rev start from 2.1
+  ("IntegratedSystemInfo", 'H'),     # Shared by various SW components
+  ("ASIC_ProfilingInfo", 'H'),       # New table name from R600, used to be called "ASIC_VDDCI_Info" for pre-R600
+  ("VoltageObjectInfo", 'H'),        # Shared by various SW components, latest version 1.1
+  ("PowerSourceInfo", 'H'),          # Shared by various SW components, latest versoin 1.1
+  ("ServiceInfo", 'H'),
 )
 
-ATOM_VRAM_ENTRY=Struct("ATOM_VRAM_ENTRY",
-  ULInt32("ulChannelMapCfg"),
-  ULInt16("usModuleSize"),
-  ULInt16("usMcRamCfg"),
-  ULInt16("usEnableChannels"),
-  Byte("ucExtMemoryID"),
-  Byte("ucMemoryType"),
-  Byte("ucChannelNum"),
-  Byte("ucChannelWidth"),
-  Byte("ucDensity"),
-  Byte("ucBankCol"),
-  Byte("ucMisc"),
-  Byte("ucVREFI"),
-  ULInt16("usReserved"),
-  ULInt16("usMemorySize"),
-  Byte("ucMcTunningSetId"),
-  Byte("ucRowNum"),
-  ULInt16("usEMRS2Value"),
-  ULInt16("usEMRS3Value"),
-  Byte("ucMemoryVenderID"),
-  Byte("ucRefreshRateFactor"),
-  Byte("ucFIFODepth"),
-  Byte("ucCDR_Bandwidth"),
-  ULInt32("ulChannelMapCfg1"),
-  ULInt32("ulBankMapCfg"),
-  ULInt32("ulReserved"),
+ATOM_VRAM_ENTRY=CompiledStruct("ATOM_VRAM_ENTRY",
+  ("ulChannelMapCfg", 'I'),
+  ("usModuleSize", 'H'),
+  ("usMcRamCfg", 'H'),
+  ("usEnableChannels", 'H'),
+  ("ucExtMemoryID", 'B'),
+  ("ucMemoryType", 'B'),
+  ("ucChannelNum", 'B'),
+  ("ucChannelWidth", 'B'),
+  ("ucDensity", 'B'),
+  ("ucBankCol", 'B'),
+  ("ucMisc", 'B'),
+  ("ucVREFI", 'B'),
+  ("usReserved", 'H'),
+  ("usMemorySize", 'H'),
+  ("ucMcTunningSetId", 'B'),
+  ("ucRowNum", 'B'),
+  ("usEMRS2Value", 'H'),
+  ("usEMRS3Value", 'H'),
+  ("ucMemoryVenderID", 'B'),
+  ("ucRefreshRateFactor", 'B'),
+  ("ucFIFODepth", 'B'),
+  ("ucCDR_Bandwidth", 'B'),
+  ("ulChannelMapCfg1", 'I'),
+  ("ulBankMapCfg", 'I'),
+  ("ulReserved", 'I'),
   #incomplete
 )
 
-ATOM_VRAM_INFO_TABLE=Struct("ATOM_VRAM_INFO_TABLE",
-  Rename("sHeader", ATOM_COMMON_TABLE_HEADER),
-  ULInt16("usMemAdjustTblOffset"),
-  ULInt16("usMemClkPatchTblOffset"),
-  ULInt16("usMcAdjustPerTileTblOffset"),
+ATOM_VRAM_INFO_TABLE=CompiledStruct("ATOM_VRAM_INFO_TABLE",
+  ("sHeader", ATOM_COMMON_TABLE_HEADER),
+  ("usMemAdjustTblOffset", 'H'),
+  ("usMemClkPatchTblOffset", 'H'),
+  ("usMcAdjustPerTileTblOffset", 'H'),
   #no not care about other entries
-  ULInt16("usMcPhyInitTableOffset"),
-  ULInt16("usDramDataRemapTblOffset"),
-  ULInt16("usReserved1"),
-  Byte("ucNumOfVRAMModule"),
-  Byte("ucMemoryClkPatchTblVer"),
-  Byte("ucVramModuleVer"),
-  Byte("ucMcPhyTileNum"),
+  ("usMcPhyInitTableOffset", 'H'),
+  ("usDramDataRemapTblOffset", 'H'),
+  ("usReserved1", 'H'),
+  ("ucNumOfVRAMModule", 'B'),
+  ("ucMemoryClkPatchTblVer", 'B'),
+  ("ucVramModuleVer", 'B'),
+  ("ucMcPhyTileNum", 'B'),
 )
 
-ATOM_VRAM_TIMING_ENTRY=Struct("ATOM_VRAM_TIMING_ENTRY",
-  ULInt32("ulClkRange"), #24 bit clock and 8 bit type
-  Bytes("ucLatency", 0x30)
-)
+construct_fields={'B': 'ULInt8', 'H': 'ULInt16', 'I': 'ULInt32'}
 
-ATOM_VRAM_TIMING_TABLE=Struct("ATOM_VRAM_TIMING_TABLE",
-  ULInt8("ucRevId"),
-  ULInt8("ucNumEntries"),
-  Array(lambda ctx: 12, ATOM_VRAM_TIMING_ENTRY)
-)
+def construct_struct(cstruct):
+  """construct Struct with the fields of a CompiledStruct"""
+  import construct
+  subcons=[]
+  for f_name, f in cstruct.fields:
+    if isinstance(f, CompiledStruct):
+      subcons+=[construct.Rename(f_name, construct_struct(f))]
+    else:
+      subcons+=[getattr(construct, construct_fields[f])(f_name)]
+  return construct.Struct(cstruct.name, *subcons)
+
+def get_compiled_struct(cstruct):
+  #(struct.Struct, layout) of a CompiledStruct
+  return cstruct.packer, cstruct.layout
+
+def _fill_container(layout, values, i=0):
+  c=Container()
+  for name, sub_layout in layout:
+    if sub_layout is None:
+      c[name]=values[i]
+      i+=1
+    else:
+      c[name], i=_fill_container(sub_layout, values, i)
+  return c, i
+
+def parse_struct(cnst, bios, offset=0):
+  #same result as cnst.parse(bios[offset:]) but reads in place without copying the tail of the image
+  packer, layout=get_compiled_struct(cnst)
+  return _fill_container(layout, packer.unpack_from(bios, offset))[0]
+
+def get_atom_rom_header_offset(bios):
+  return struct.unpack_from('<H', bios, atom_rom_header_ptr)[0]
@@ -1,124 +1,127 @@
 import optparse
 import sys
 import re
-from construct import *
+import struct
+import binascii
+import collections
+import threading
 
 def hexify(a):
-  return  "".join("%02x" % int(b) for b in a)
-
-#register structures borrowed from gmc_8_1_sh_mask.h
-
-MC_SEQ_WR_CTL_Dx=BitStruct("MC_SEQ_WR_CTL_Dx", #last field is lowest bits
-  BitField("unused2", 1),    #Unused
-  BitField("CMD_DLY", 1),
-  BitField("ADR_DLY", 1),
-  BitField("ODT_EXT", 1),
-  BitField("ODT_DLY", 4),
-  BitField("unused1", 2),    #Unused
-  BitField("OEN_SEL", 2),
-  BitField("OEN_EXT", 4),
-  BitField("OEN_DLY", 4),
-  BitField("CMD_2Y_DLY", 1),
-  BitField("ADR_2Y_DLY", 1),
-  BitField("DAT_2Y_DLY", 1),
-  BitField("DQS_XTR", 1),
-  BitField("DQS_DLY", 4),
-  BitField("DAT_DLY", 4),
-)
+  return binascii.hexlify(bytes(a))
+
+#register structures borrowed from gmc_8_1_sh_mask.h as (field name, width in bits)
+
+MC_SEQ_WR_CTL_Dx=[ #last field is lowest bits
+  ("unused2", 1),    #Unused
+  ("CMD_DLY", 1),
+  ("ADR_DLY", 1),
+  ("ODT_EXT", 1),
+  ("ODT_DLY", 4),
+  ("unused1", 2),    #Unused
+  ("OEN_SEL", 2),
+  ("OEN_EXT", 4),
+  ("OEN_DLY", 4),
+  ("CMD_2Y_DLY", 1),
+  ("ADR_2Y_DLY", 1),
+  ("DAT_2Y_DLY", 1),
+  ("DQS_XTR", 1),
+  ("DQS_DLY", 4),
+  ("DAT_DLY", 4),
+]
 
 #some bioses with GDDR3 memory have non zero values consistant with this structure
-MC_SEQ_WR_CTL_2=BitStruct("MC_SEQ_WR_CTL_2", #last field is lowest bits
-  BitField("unused2", 25),     #Unused
-  BitField("WCDR_EN", 1),
-  BitField("OEN_DLY_H_D1", 1),
-  BitField("DQS_DLY_H_D1", 1),
-  BitField("DAT_DLY_H_D1", 1),
-  BitField("OEN_DLY_H_D0", 1),
-  BitField("DQS_DLY_H_D0", 1),
-  BitField("DAT_DLY_H_D0", 1),
-)
-
-MC_SEQ_RAS_TIMING=BitStruct("MC_SEQ_RAS_TIMING", #last field is lowest bits
-  BitField("unused1", 1), #Unused
-  BitField("TRC", 7),     #Number of cycles from active to active/auto refresh -1
-  BitField("TRRD", 4),    #Number of cycles from active bank a to active bank b -1
-  BitField("TRCDRA", 5),  #Number of cycles from active to read with auto-precharge -1
-  BitField("TRCDR", 5),   #Number of cycles from active to read -1
-  BitField("TRCDWA", 5),  #Number of cycles from active to write with auto-precharge -1
-  BitField("TRCDW", 5),   #Number of cycles from active to write -1
-)
-
-MC_SEQ_CAS_TIMING=BitStruct("MC_SEQ_CAS_TIMING", #last field is lowest bits
-  Bits("unused2", 3), #Unused
-  Bits("TCL", 5),     #CAS to data return latency
-  Bits("unused1", 3), #Unused
-  Bits("TW2R", 5),    #Write to read turn
-  Bits("TR2R", 4),    #Read to read time
-  Bits("TCCDL", 3),   #Cycles between r/w from bank A to r/w bank B.
-  Bits("TR2W", 5),    #Read to write turn -1
-  Bits("TNOPR", 2),   #Extra cycle(s) between successive read bursts
-  Bits("TNOPW", 2),   #Extra cycle(s) between successive write bursts
-)
-
-MC_SEQ_MISC_TIMING_R9=BitStruct("MC_SEQ_MISC_TIMING_R9", #last field is lowest bits
-  Bits("unused3", 3), #Unused
-  Bits("TRFC", 9),    #Auto-refresh command period - 1
-  Bits("TRP", 5),     #Precharge command period - 1
-  Bits("unused2", 1), #Unused but defined as 1
-  Bits("TRP_RDA", 6), #From read with auto-precharge to active - 1
-  Bits("unused1", 2), #Unused
-  Bits("TRP_WRA", 6), #From write with auto-precharge to active - 1
-)
-
-MC_SEQ_MISC_TIMING_RX=BitStruct("MC_SEQ_MISC_TIMING_RX", #last field is lowest bits
-  Bits("unused3", 3), #Unused
-  Bits("TRFC", 9),    #Auto-refresh command period - 1
-  Bits("unused2", 1), #Unused
-  Bits("TRP", 5),     #Precharge command period - 1
-  Bits("unused1", 1), #Unused
-  Bits("TRP_RDA", 6), #From read with auto-precharge to active - 1
-  Bits("TRP_WRA", 7), #From write with auto-precharge to active - 1
-)
-
-MC_SEQ_MISC_TIMING2=BitStruct("MC_SEQ_MISC_TIMING2", #last field is lowest bits
-  Bits("TWDATATR", 4),
-  Bits("unused3", 3), #Unused
-  Bits("T32AW", 4),
-  Bits("TWEDC", 5),
-  Bits("TREDC", 3),
-  Bits("FAW", 5),
-  Bits("unused2", 1), #Unused
-  Bits("PA2WDATA", 3),
-  Bits("unused1", 1), #Unused
-  Bits("PA2RDATA", 3),
-)
-
-MC_SEQ_PMG_TIMING=BitStruct("MC_SEQ_PMG_TIMING", #last field is lowest bits
-  Bits("SEQ_IDLE_SS", 8),
-  Bits("TCKE_PULSE_MSB", 1),
-  Bits("unused3", 2), #Unused
-  Bits("SEQ_IDLE", 3),
-  Bits("TCKE", 6),
-  Bits("TCKE_PULSE", 4),
-  Bits("unused2", 1), #Unused
-  Bits("TCKSRX", 3),
-  Bits("unused1", 1), #Unused
-  Bits("TCKSRE", 3),
-)
-
-MC_ARB_DRAM_TIMING=BitStruct("MC_ARB_DRAM_TIMING", #last field is lowest bits
-  Bits("RASMACTWR", 8),
-  Bits("RASMACTRD", 8),
-  Bits("ACTWR", 8),
-  Bits("ACTRD", 8)
-)
-
-MC_ARB_DRAM_TIMING2=BitStruct("MC_ARB_DRAM_TIMING2", #last field is lowest bits
-  Bits("BUS_TURN", 8),
-  Bits("WRPLUSRP", 8),
-  Bits("RP", 8),
-  Bits("RAS2RAS", 8),
-)
+MC_SEQ_WR_CTL_2=[ #last field is lowest bits
+  ("unused2", 25),     #Unused
+  ("WCDR_EN", 1),
+  ("OEN_DLY_H_D1", 1),
+  ("DQS_DLY_H_D1", 1),
+  ("DAT_DLY_H_D1", 1),
+  ("OEN_DLY_H_D0", 1),
+  ("DQS_DLY_H_D0", 1),
+  ("DAT_DLY_H_D0", 1),
+]
+
+MC_SEQ_RAS_TIMING=[ #last field is lowest bits
+  ("unused1", 1), #Unused
+  ("TRC", 7),     #Number of cycles from active to active/auto refresh -1
+  ("TRRD", 4),    #Number of cycles from active bank a to active bank b -1
+  ("TRCDRA", 5),  #Number of cycles from active to read with auto-precharge -1
+  ("TRCDR", 5),   #Number of cycles from active to read -1
+  ("TRCDWA", 5),  #Number of cycles from active to write with auto-precharge -1
+  ("TRCDW", 5),   #Number of cycles from active to write -1
+]
+
+MC_SEQ_CAS_TIMING=[ #last field is lowest bits
+  ("unused2", 3), #Unused
+  ("TCL", 5),     #CAS to data return latency
+  ("unused1", 3), #Unused
+  ("TW2R", 5),    #Write to read turn
+  ("TR2R", 4),    #Read to read time
+  ("TCCDL", 3),   #Cycles between r/w from bank A to r/w bank B.
+  ("TR2W", 5),    #Read to write turn -1
+  ("TNOPR", 2),   #Extra cycle(s) between successive read bursts
+  ("TNOPW", 2),   #Extra cycle(s) between successive write bursts
+]
+
+MC_SEQ_MISC_TIMING_R9=[ #last field is lowest bits
+  ("unused3", 3), #Unused
+  ("TRFC", 9),    #Auto-refresh command period - 1
+  ("TRP", 5),     #Precharge command period - 1
+  ("unused2", 1), #Unused but defined as 1
+  ("TRP_RDA", 6), #From read with auto-precharge to active - 1
+  ("unused1", 2), #Unused
+  ("TRP_WRA", 6), #From write with auto-precharge to active - 1
+]
+
+MC_SEQ_MISC_TIMING_RX=[ #last field is lowest bits
+  ("unused3", 3), #Unused
+  ("TRFC", 9),    #Auto-refresh command period - 1
+  ("unused2", 1), #Unused
+  ("TRP", 5),     #Precharge command period - 1
+  ("unused1", 1), #Unused
+  ("TRP_RDA", 6), #From read with auto-precharge to active - 1
+  ("TRP_WRA", 7), #From write with auto-precharge to active - 1
+]
+
+MC_SEQ_MISC_TIMING2=[ #last field is lowest bits
+  ("TWDATATR", 4),
+  ("unused3", 3), #Unused
+  ("T32AW", 4),
+  ("TWEDC", 5),
+  ("TREDC", 3),
+  ("FAW", 5),
+  ("unused2", 1), #Unused
+  ("PA2WDATA", 3),
+  ("unused1", 1), #Unused
+  ("PA2RDATA", 3),
+]
+
+MC_SEQ_PMG_TIMING=[ #last field is lowest bits
+  ("SEQ_IDLE_SS", 8),
+  ("TCKE_PULSE_MSB", 1),
+  ("unused3", 2), #Unused
+  ("SEQ_IDLE", 3),
+  ("TCKE", 6),
+  ("TCKE_PULSE", 4),
+  ("unused2", 1), #Unused
+  ("TCKSRX", 3),
+  ("unused1", 1), #Unused
+  ("TCKSRE", 3),
+]
+
+MC_ARB_DRAM_TIMING=[ #last field is lowest bits
+  ("RASMACTWR", 8),
+  ("RASMACTRD", 8),
+  ("ACTWR", 8),
+  ("ACTRD", 8)
+]
+
+MC_ARB_DRAM_TIMING2=[ #last field is lowest bits
+  ("BUS_TURN", 8),
+  ("WRPLUSRP", 8),
+  ("RP", 8),
+  ("RAS2RAS", 8),
+]
 
 mc_offsets={
   'RX': {
@@ -152,67 +155,205 @@ timing_register_names=[
   'MC_ARB_DRAM_TIMING', 'MC_ARB_DRAM_TIMING2'
 ]
 
-def format_register_string(bios_type, timing, register_name=None):
+def compile_register(register):
+  #turn a 32 bit register definition into (name, shift, mask) tuples, first field is highest bits
+  fields=[]
+  shift=sum(width for name, width in register)
+  for name, width in register:
+    shift-=width
+    fields+=[(name, shift, (1 << width)-1)]
+  return tuple(fields)
+
+def compile_registers(bios_type):
+  codecs={}
+  for r_name in timing_register_names:
+    var_name=r_name
+    if r_name=='MC_SEQ_MISC_TIMING':
+      var_name+='_'+bios_type
+    codecs[r_name]=(mc_offsets[bios_type][r_name], compile_register(globals()[var_name]))
+  return codecs
+
+#register name -> (offset in timing string, fields) for every bios type
+register_codecs=dict((bios_type, compile_registers(bios_type)) for bios_type in mc_offsets.keys())
+
+def index_subregisters(bios_type):
+  index={}
+  for r_name in timing_register_names: #first register wins like the old linear search
+    offset, fields=register_codecs[bios_type][r_name]
+    for name, shift, mask in fields:
+      if name[0:6]!='unused':
+        index.setdefault((bios_type, name), (r_name, offset, shift, mask.bit_length()))
+  return index
+
+#(bios type, subregister name) -> (register name, offset in timing string, bit position, width)
+subregister_index={}
+for bios_type in mc_offsets.keys():
+  subregister_index.update(index_subregisters(bios_type))
+
+def lookup_subregister(bios_type, register_subname):
   if bios_type not in ['RX', 'R9']:
     sys.exit('Wrong bios type')
+  if register_subname[0:6]=='unused':
+    sys.exit("Unused does not allowed in registers")
+  r=subregister_index.get((bios_type, register_subname))
+  if r is None:
+    sys.exit("Unknown subregister")
+  return r
 
-  if type(register_name) is list:
-    return ','.join([format_register_string(bios_type, timing, r) for r in register_name])
+def get_subregister(bios_type, register_subname, timing_raw):
+  r_name, offset, shift, width=lookup_subregister(bios_type, register_subname)
+  return (struct.unpack_from('<I', timing_raw, offset)[0] >> shift) & ((1 << width)-1)
 
-  if register_name is None:
-    return format_register_string(bios_type, timing, timing_register_names)
+def set_subregister(bios_type, register_subname, timing_raw, value):
+  r_name, offset, shift, width=lookup_subregister(bios_type, register_subname)
+  if value<0:
+    sys.exit("Negative value %d for subregister %s" % (value, register_subname))
+  mask=(1 << width)-1
+  if value>mask:
+    sys.exit("Value %d does not fit into %d bits of subregister %s" % (value, width, register_subname))
+  r=struct.unpack_from('<I', timing_raw, offset)[0]
+  struct.pack_into('<I', timing_raw, offset, (r & ~(mask << shift)) | ((value & mask) << shift))
 
-  if register_name not in mc_offsets[bios_type].keys():
-    sys.exit('Wrong register')
+def decode_register(bios_type, register_name, timing_raw):
+  offset, fields=register_codecs[bios_type][register_name]
+  r=struct.unpack_from('<I', timing_raw, offset)[0]
+  return [(name, (r >> shift) & mask) for name, shift, mask in fields]
 
-  offset=mc_offsets[bios_type][register_name]
-  timing_raw=bytearray(timing.decode("hex"))
-  r_raw=timing_raw[offset:offset+4][::-1]
+class RegisterCache(object):
+  """Bounded LRU of decoded registers keyed by (bios type, timing string), shared by all dumps and threads in the process"""
 
-  if register_name in timing_register_names:
-    var_name=register_name
-    if register_name=='MC_SEQ_MISC_TIMING':
-      var_name+='_'+bios_type
-    r=globals()[var_name].parse(r_raw)
-    attrs=list(reversed(r.keys()))
-    r_string=(','.join([a+'=%03d' for a in attrs])) % tuple ([getattr(r,a) for a in attrs])
-  else:
-    sys.exit('Wrong register, should not happen')
+  def __init__(self, max_size=4096):
+    self.max_size=max_size
+    self.entries=collections.OrderedDict()
+    self.hits=0
+    self.misses=0
+    self.lock=threading.Lock() #the OrderedDict links break under concurrent pop/insert
 
-  return '['+r_string+']'
+  def get(self, bios_type, timing):
+    #returns ({register name: decoded fields}, {register name: formatted string}), strings are filled in by users
+    key=(bios_type, bytes(timing))
+    with self.lock:
+      entry=self.entries.pop(key, None)
+      if entry is not None:
+        self.hits+=1
+        self.entries[key]=entry
+        return entry
+      self.misses+=1
+    entry=(dict((r_name, decode_register(bios_type, r_name, timing)) for r_name in timing_register_names), {}) #decoded outside the lock
+    with self.lock:
+      entry=self.entries.pop(key, entry) #another thread may have stored it meanwhile
+      while len(self.entries)>=self.max_size:
+        self.entries.popitem(last=False)
+      self.entries[key]=entry
+    return entry
 
-def set_register_in_string(bios_type, register_subname, register_value, eqop, timing):
-  if register_subname[0:6]=='unused':
-    sys.exit("Unused does not allowed in registers")
+  def clear(self):
+    with self.lock:
+      self.entries.clear()
+      self.hits=0
+      self.misses=0
+
+register_cache=RegisterCache()
 
-  timing_raw=bytearray(timing.decode("hex"))
+#every subregister of many straps at once, straps are rows of a uint32 matrix and fields are columns
 
-  found=False
+numpy=False #imported on first use, it takes longer than the rest of the startup
+
+def get_numpy():
+  """NumPy module or None if it is not installed"""
+  global numpy
+  if numpy is False:
+    try:
+      import numpy
+    except ImportError:
+      numpy=None
+  return numpy
+
+def require_numpy():
+  if get_numpy() is None:
+    sys.exit('NumPy is required for columnar decoding')
+  return numpy
+
+def strap_matrix(timings, timing_entry_length=0x30):
+  """uint32 matrix with one row per timing string and one column per 32 bit word"""
+  require_numpy()
+  data=b''.join(bytes(s) for s in timings)
+  if len(data)!=len(timings)*timing_entry_length:
+    sys.exit('Wrong timing string length')
+  return numpy.frombuffer(data, dtype='<u4').reshape(len(timings), timing_entry_length/4)
+
+def decode_columns(bios_type, matrix):
+  """Ordered {subregister name: uint32 column}, unused fields skipped and the first register wins like in get_subregister"""
+  require_numpy()
+  if bios_type not in mc_offsets:
+    sys.exit('Wrong bios type')
+  columns=collections.OrderedDict()
   for r_name in timing_register_names:
-    var_name=r_name
-    if r_name=='MC_SEQ_MISC_TIMING':
-      var_name+='_'+bios_type
-    cnst=globals()[var_name]
-    offset=mc_offsets[bios_type][r_name]
-    attrs=cnst.parse('0000').keys()
-    if register_subname in attrs:
-      found=True
-      break
-
-  if not found:
-    sys.exit("Unknown subregister")
+    offset, fields=register_codecs[bios_type][r_name]
+    word=matrix[:, offset/4]
+    for name, shift, mask in fields:
+      if subregister_index.get((bios_type, name), (None, ))[0]==r_name:
+        columns[name]=(word >> shift) & mask
+  return columns
+
+def index_fields(bios_type):
+  #(name, register name, position in the register's fields) of every used subregister, first register wins
+  index=[]
+  for r_name in timing_register_names:
+    offset, fields=register_codecs[bios_type][r_name]
+    for i, (name, shift, mask) in enumerate(fields):
+      if subregister_index.get((bios_type, name), (None, ))[0]==r_name:
+        index+=[(name, r_name, i)]
+  return index
+
+#bios type -> subregisters in decode_columns order
+field_index=dict((bios_type, index_fields(bios_type)) for bios_type in mc_offsets.keys())
 
-  r_raw=timing_raw[offset:offset+4][::-1]
-  r=cnst.parse(r_raw)
+def decode_fields(bios_type, timing):
+  """[(subregister name, value)] of one timing string in decode_columns order, unused fields skipped"""
+  if bios_type not in mc_offsets:
+    sys.exit('Wrong bios type')
+  registers=register_cache.get(bios_type, timing)[0]
+  return [(name, registers[r_name][i][1]) for name, r_name, i in field_index[bios_type]]
+
+def format_register_string(bios_type, timing, register_name=None):
+  if bios_type not in ['RX', 'R9']:
+    sys.exit('Wrong bios type')
+
+  if register_name is None:
+    register_name=timing_register_names
+
+  entry=None
+  r_strings=[]
+  for r in (register_name if type(register_name) is list else [register_name]):
+    if r in timing_register_names:
+      if entry is None: #one cache lookup for all registers of the timing string
+        entry=register_cache.get(bios_type, timing)
+      fields, strings=entry
+      r_string=strings.get(r)
+      if r_string is None:
+        r_string=strings[r]=','.join(['%s=%03d' % a for a in reversed(fields[r])])
+    elif (bios_type, r) in subregister_index:
+      r_string='%s=%03d' % (r, get_subregister(bios_type, r, timing))
+    elif r in mc_offsets[bios_type]:
+      sys.exit('Wrong register, should not happen')
+    else:
+      sys.exit('Wrong register')
+    r_strings+=['['+r_string+']']
+
+  return ','.join(r_strings)
+
+def set_register_in_string(bios_type, register_subname, register_value, eqop, timing):
+  #timing is a raw timing string (bytearray) and is changed in place
+  value=get_subregister(bios_type, register_subname, timing)
   if eqop=='=':
-    r.__setattr__(register_subname, int(register_value))
+    value=int(register_value)
   elif eqop=='-=':
-    r.__setattr__(register_subname, int(r.__getattr__(register_subname))-int(register_value))
+    value-=int(register_value)
   elif eqop=='+=':
-    r.__setattr__(register_subname, int(r.__getattr__(register_subname))+int(register_value))
+    value+=int(register_value)
   else:
     sys.exit("Bad set operation %s for register" % eqop)
-  r_raw=cnst.build(r)
-  timing_raw[offset:offset+4]=r_raw[::-1]
+  set_subregister(bios_type, register_subname, timing, value)
 
-  return hexify(timing_raw)
+  return timing
@@ -0,0 +1,108 @@
+import sys
+import re
+import struct
+from atom_rom import ATOM_ROM_HEADER, ATOM_MASTER_DATA_TABLE, ATOM_VRAM_INFO_TABLE, parse_struct, get_atom_rom_header_offset
+
+#bios type and timing table layout by signatures, the first matching kind in signature_kinds order wins
+
+signature_kinds=['version', 'part', 'device', 'vram_info']
+
+#(kind, key, bios type, timing entry length, timing table offset relative to the default one)
+#version keys are prefixes of the version after 'AMD VER'/'ATI VER', part keys are strings in the first 1024 bytes,
+#device keys usDeviceID of ATOM_ROM_HEADER and vram_info keys (format, content) revisions of ATOM_VRAM_INFO_TABLE
+bios_signatures=[
+  ('version', '015.00', 'R9', 0x30, 0),
+  ('version', '015.01', 'R9', 0x30, 0),
+  ('version', '015.02', 'R9', 0x30, 0),
+  ('version', '015.03', 'R9', 0x30, 0),
+  ('version', '015.04', 'R9', 0x30, 0),
+  ('version', '015.05', 'RX', 0x30, 0),
+  ('part', 'GV-R938XG1 GAMING-4GD/F2/0347', 'R9', 0x30, 0),
+  ('part', '113-C3340400-101.TURKS.PCI_EXPRESS.GDDR5', 'R9', 0x30, 0),
+  ('device', 0x67b0, 'R9', 0x30, 0), #hawaii
+  ('device', 0x67b1, 'R9', 0x30, 0),
+  ('device', 0x67b9, 'R9', 0x30, 0),
+  ('device', 0x6938, 'R9', 0x30, 0), #tonga
+  ('device', 0x6939, 'R9', 0x30, 0),
+  ('device', 0x6798, 'R9', 0x30, 0), #tahiti
+  ('device', 0x679a, 'R9', 0x30, 0),
+  ('device', 0x6810, 'R9', 0x30, 0), #pitcairn
+  ('device', 0x6811, 'R9', 0x30, 0),
+  ('device', 0x67df, 'RX', 0x30, 0), #ellesmere
+  ('device', 0x6fdf, 'RX', 0x30, 0),
+  ('device', 0x67ef, 'RX', 0x30, 0), #baffin
+  ('device', 0x67ff, 'RX', 0x30, 0),
+  ('device', 0x699f, 'RX', 0x30, 0), #lexa
+  ('vram_info', (2, 1), 'R9', 0x30, 0),
+  ('vram_info', (2, 2), 'RX', 0x30, 0),
+]
+
+#bioses with a version string nothing else matched were always taken as R9
+default_signature=('default', None, 'R9', 0x30, 0)
+
+def compile_signatures(signatures):
+  #one regex with a group per version/part signature for the text ones, dicts for the structural ones
+  patterns=[]
+  lookup={}
+  for n, s in enumerate(signatures):
+    kind, key=s[0], s[1]
+    if kind=='version':
+      patterns+=['(?P<s%d>(?:AMD|ATI) VER%s)' % (n, re.escape(key))]
+    elif kind=='part':
+      patterns+=['(?P<s%d>%s)' % (n, re.escape(key))]
+    elif kind in signature_kinds:
+      lookup.setdefault((kind, key), s)
+    else:
+      sys.exit('Unknown signature kind %s' % kind)
+  patterns+=['(?P<version>(?:AMD|ATI) VER)']
+  return re.compile('|'.join(patterns)), lookup
+
+signature_regex, signature_lookup=compile_signatures(bios_signatures)
+
+def read_signature_keys(bios):
+  #device id and vram info revision, None where the tables can not be read
+  try:
+    atom_rom_header=parse_struct(ATOM_ROM_HEADER, bios, get_atom_rom_header_offset(bios))
+    atom_master_data_table=parse_struct(ATOM_MASTER_DATA_TABLE, bios, atom_rom_header.usMasterDataTableOffset)
+    header=parse_struct(ATOM_VRAM_INFO_TABLE, bios, atom_master_data_table.VRAM_Info).sHeader
+    return atom_rom_header.usDeviceID, (header.ucTableFormatRevision, header.ucTableContentRevision)
+  except struct.error:
+    return None, None
+
+def match_signatures(head, device_id, vram_info_revision):
+  matches=dict((kind, None) for kind in signature_kinds)
+  version=False
+  for m in signature_regex.finditer(head):
+    name=m.lastgroup
+    if name=='version':
+      version=True
+      continue
+    s=bios_signatures[int(name[1:])]
+    version=version or s[0]=='version'
+    if matches[s[0]] is None: #first in the bios like find
+      matches[s[0]]=s
+  matches['device']=signature_lookup.get(('device', device_id))
+  matches['vram_info']=signature_lookup.get(('vram_info', vram_info_revision))
+  for kind in signature_kinds:
+    if matches[kind] is not None:
+      return matches[kind]
+  if version:
+    return default_signature
+  return None
+
+#detection input -> signature, identical roms of a fleet are matched once
+signature_cache={}
+signature_cache_size=4096
+
+def detect_bios_signature(bios):
+  """Signature tuple (kind, key, bios type, timing entry length, relative timing table offset) or None"""
+  head=bytes(bios[0:1024])
+  device_id, vram_info_revision=read_signature_keys(bios)
+  key=(head, device_id, vram_info_revision)
+  if key in signature_cache:
+    return signature_cache[key]
+  s=match_signatures(head, device_id, vram_info_revision)
+  if len(signature_cache)>=signature_cache_size:
+    signature_cache.clear()
+  signature_cache[key]=s
+  return s
@@ -0,0 +1,168 @@
+import optparse
+import sys
+import os
+import hashlib
+import sqlite3
+from atom_timings_editor import BiosImage, hexify
+from atom_timings_batch import expand_inputs
+
+#straps of a rom collection stored once by content hash, roms are only rescanned when they change
+
+strap_db_schema='''
+create table if not exists roms (
+  path text primary key,
+  size integer,
+  mtime real,
+  rom_hash text,
+  bios_version text,
+  type text,
+  status text
+);
+create table if not exists straps (
+  hash text primary key,
+  timing blob
+);
+create table if not exists rom_straps (
+  path text references roms(path) on delete cascade,
+  position integer,
+  freq integer,
+  module integer,
+  vendor_id integer,
+  hash text references straps(hash),
+  primary key (path, position)
+);
+create index if not exists rom_straps_hash on rom_straps(hash);
+create index if not exists rom_straps_freq on rom_straps(freq, vendor_id);
+'''
+
+def strap_hash(timing):
+  return hashlib.sha1(bytes(timing)).hexdigest()
+
+def open_strap_db(path):
+  db=sqlite3.connect(path)
+  db.execute('pragma foreign_keys=on')
+  db.executescript(strap_db_schema)
+  return db
+
+def scan_rom(bios):
+  #(bios version, type, [(freq, module, vendor id, timing)]) or SystemExit for bioses without a usable table
+  image=BiosImage(bios)
+  bios_version=image.bios_version
+  bios_version=str(bios_version).strip('\0 ') if bios_version is not None else None
+  if image.timing_table_length==0:
+    sys.exit('Could not find timing table')
+  vram_modules=image.vram_modules
+  straps=[]
+  for c, t, s in image.timing_table:
+    vendor_id=vram_modules[t].ucMemoryVenderID if t<len(vram_modules) else None
+    straps+=[(c, t, vendor_id, s)]
+  return bios_version, image.timing_entry_type, straps
+
+def index_rom(db, path, force=False):
+  """Index the straps of one rom, returns 'skipped', 'updated', 'ok' or the error message"""
+  st=os.stat(path)
+  row=db.execute('select size, mtime, rom_hash from roms where path=?', (path, )).fetchone()
+  if not force and row is not None and row[0]==st.st_size and row[1]==st.st_mtime:
+    return 'skipped'
+
+  with open(path, 'rb') as bios_file:
+    bios=bytearray(bios_file.read())
+  rom_hash=hashlib.sha1(bios).hexdigest()
+  if not force and row is not None and row[2]==rom_hash: #touched but not changed
+    db.execute('update roms set size=?, mtime=? where path=?', (st.st_size, st.st_mtime, path))
+    return 'skipped'
+
+  try:
+    bios_version, timing_entry_type, straps=scan_rom(bios)
+    status='ok'
+  except SystemExit as e:
+    bios_version, timing_entry_type, straps=None, None, []
+    status=str(e)
+  except Exception as e:
+    bios_version, timing_entry_type, straps=None, None, []
+    status='%s: %s' % (type(e).__name__, e)
+
+  db.execute('delete from rom_straps where path=?', (path, ))
+  db.execute('insert or replace into roms values (?, ?, ?, ?, ?, ?, ?)', (path, st.st_size, st.st_mtime, rom_hash, bios_version, timing_entry_type, status))
+  hashes=[strap_hash(s) for c, t, v, s in straps]
+  db.executemany('insert or ignore into straps values (?, ?)', [(h, sqlite3.Binary(bytes(s))) for h, (c, t, v, s) in zip(hashes, straps)])
+  db.executemany('insert into rom_straps values (?, ?, ?, ?, ?, ?)', [(path, i, c, t, v, h) for i, (h, (c, t, v, s)) in enumerate(zip(hashes, straps))])
+  if status=='ok' and row is not None:
+    return 'updated'
+  return status
+
+def index_roms(db, paths, force=False, prune=False):
+  """Index roms committing per file, yields (path, status)"""
+  for path in paths:
+    path=os.path.abspath(path)
+    status=index_rom(db, path, force)
+    db.commit()
+    yield path, status
+  if prune:
+    for path, in db.execute('select path from roms').fetchall():
+      if not os.path.isfile(path):
+        db.execute('delete from roms where path=?', (path, ))
+        yield path, 'removed'
+    db.execute('delete from straps where hash not in (select hash from rom_straps)')
+    db.commit()
+
+def find_roms(db, timing):
+  """Roms carrying the strap given as timing bytes or its hash"""
+  h=timing if isinstance(timing, basestring) and len(timing)==40 else strap_hash(timing)
+  return db.execute('''select r.path, r.bios_version, r.type, s.freq, s.module, s.vendor_id from rom_straps s join roms r on r.path=s.path
+    where s.hash=? order by r.path, s.position''', (h, )).fetchall()
+
+def find_straps(db, freq=None, vendor_id=None, timing_entry_type=None):
+  """Distinct straps matching the filters, the one used by most roms first"""
+  where, args=[], []
+  if freq is not None:
+    where+=['s.freq=?']
+    args+=[freq]
+  if vendor_id is not None:
+    where+=['s.vendor_id=?']
+    args+=[vendor_id]
+  if timing_entry_type is not None:
+    where+=['r.type=?']
+    args+=[timing_entry_type]
+  rows=db.execute('''select count(distinct s.path), s.hash, min(s.freq), max(s.freq), t.timing from rom_straps s join roms r on r.path=s.path join straps t on t.hash=s.hash
+    %s group by s.hash order by count(distinct s.path) desc, s.hash''' % ('where '+' and '.join(where) if where else ''), args).fetchall()
+  return [(n, h, fmin, fmax, bytearray(t)) for n, h, fmin, fmax, t in rows]
+
+if __name__ == '__main__':
+  parser = optparse.OptionParser(usage="%prog [options] [<rom|dir|glob>...]")
+  parser.add_option("-d", "--database", dest="database", default="straps.db", help="SQLite index file (default straps.db)")
+  parser.add_option("--pattern", dest="pattern", default="*.rom", help="File pattern used for input directories (default *.rom)")
+  parser.add_option("--force", dest="force", action="store_true", default=False, help="Reindex roms even if they did not change")
+  parser.add_option("--prune", dest="prune", action="store_true", default=False, help="Drop roms which no longer exist from the index")
+  parser.add_option("--strap", dest="strap", default=None, help="List roms carrying the strap given as hex timings or hash")
+  parser.add_option("--freq", dest="freq", default=None, help="List straps for frequency (same units as the timing table, 175000 is 1750 MHz)")
+  parser.add_option("--vendor", dest="vendor_id", default=None, help="List straps for ucMemoryVenderID")
+  parser.add_option("--type", dest="timing_entry_type", default=None, help="List straps of bioses of type R9 or RX")
+
+  (options, args) = parser.parse_args()
+
+  query=options.strap is not None or options.freq is not None or options.vendor_id is not None or options.timing_entry_type is not None
+  if not args and not query and not options.prune:
+    parser.error("Roms to index or a query is required")
+
+  db=open_strap_db(options.database)
+  try:
+    if args or options.prune:
+      counts={}
+      for path, status in index_roms(db, expand_inputs(args, options.pattern), options.force, options.prune):
+        if status not in ['ok', 'updated', 'skipped', 'removed']:
+          print >>sys.stderr, "%s: %s" % (path, status)
+          status='failed'
+        counts[status]=counts.get(status, 0)+1
+      print >>sys.stderr, ', '.join('%d %s' % (counts[s], s) for s in ['ok', 'updated', 'skipped', 'removed', 'failed'] if s in counts) or 'nothing indexed'
+
+    if options.strap is not None:
+      strap=options.strap if len(options.strap)==40 else bytearray.fromhex(options.strap)
+      for path, bios_version, timing_entry_type, freq, module, vendor_id in find_roms(db, strap):
+        print freq, module, vendor_id if vendor_id is not None else '-', timing_entry_type, bios_version or '-', path
+    elif query:
+      for n, h, fmin, fmax, timing in find_straps(db, int(options.freq) if options.freq is not None else None,
+          int(options.vendor_id, 0) if options.vendor_id is not None else None, options.timing_entry_type):
+        print n, h, fmin if fmin==fmax else '%d-%d' % (fmin, fmax), hexify(timing)
+  finally:
+    db.close()
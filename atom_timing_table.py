@@ -0,0 +1,125 @@
+import sys
+import struct
+from array import array
+
+#timing table as arrays: clocks in array('I'), vram module types in array('B') and the timing strings
+#back to back in one bytearray, about the raw bios size per entry instead of a list of python objects
+
+class TimingEntry(object):
+  """Read only view of one entry, unpacks as (clk, type, timing string) like the lists it replaces"""
+  __slots__=('table', 'id')
+
+  def __init__(self, table, id_):
+    self.table=table
+    self.id=id_
+
+  @property
+  def clk(self):
+    return self.table.clocks[self.id]
+
+  @property
+  def type(self):
+    return self.table.types[self.id]
+
+  @property
+  def timing(self):
+    return self.table.timing(self.id)
+
+  def __iter__(self):
+    return iter((self.clk, self.type, self.timing))
+
+  def __len__(self):
+    return 3
+
+  def __getitem__(self, i):
+    return (self.clk, self.type, self.timing)[i]
+
+  def __repr__(self):
+    return 'TimingEntry(%d, %d, %s)' % (self.clk, self.type, bytes(self.timing).encode('hex'))
+
+class TimingTable(object):
+  """Timing table entries, changed only through set_timing/append so snapshots stay as they were"""
+  __slots__=('clocks', 'types', 'timings', 'timing_entry_length', 'shared')
+
+  def __init__(self, timing_entry_length=0x30, clocks=None, types=None, timings=None):
+    self.timing_entry_length=timing_entry_length
+    self.clocks=clocks if clocks is not None else array('I')
+    self.types=types if types is not None else array('B')
+    self.timings=timings if timings is not None else bytearray()
+    self.shared=False #buffers are shared with a snapshot and copied on the next write
+
+  @classmethod
+  def from_entries(cls, entries, timing_entry_length=None):
+    """Table of (clk, type, timing string) entries, timing entry length by the first entry if not given"""
+    table=cls(timing_entry_length)
+    for c, t, s in entries:
+      table.append(c, t, s)
+    if table.timing_entry_length is None:
+      table.timing_entry_length=0x30
+    return table
+
+  @classmethod
+  def from_buffer(cls, data, offset, length, timing_entry_length=0x30):
+    """Table of length entries packed like in the bios (clock with type in the top byte, timing string) at offset of data"""
+    entry_size=timing_entry_length+4
+    if offset+entry_size*length>len(data):
+      sys.exit('Timing table is out of bios')
+    clks=[struct.unpack_from('<I', data, offset+entry_size*i)[0] for i in xrange(length)]
+    timings=bytearray(b''.join(bytes(data[offset+entry_size*i+4:offset+entry_size*(i+1)]) for i in xrange(length)))
+    return cls(timing_entry_length, array('I', [c & 0xffffff for c in clks]), array('B', [c >> 24 for c in clks]), timings)
+
+  def __len__(self):
+    return len(self.clocks)
+
+  def __getitem__(self, id_):
+    if id_<0:
+      id_+=len(self.clocks)
+    if not 0<=id_<len(self.clocks):
+      raise IndexError('timing table index out of range')
+    return TimingEntry(self, id_)
+
+  def __iter__(self):
+    for id_ in xrange(len(self.clocks)):
+      yield TimingEntry(self, id_)
+
+  def timing(self, id_):
+    #timing string as str, changes go through set_timing
+    return bytes(self.timings[id_*self.timing_entry_length:(id_+1)*self.timing_entry_length])
+
+  def _own(self):
+    if self.shared:
+      self.clocks=array('I', self.clocks)
+      self.types=array('B', self.types)
+      self.timings=bytearray(self.timings)
+      self.shared=False
+
+  def set_timing(self, id_, timing):
+    if len(timing)!=self.timing_entry_length:
+      sys.exit('Wrong timing entry length %d' % len(timing))
+    self._own()
+    self.timings[id_*self.timing_entry_length:(id_+1)*self.timing_entry_length]=timing
+
+  def append(self, clk, type_, timing):
+    if self.timing_entry_length is None:
+      self.timing_entry_length=len(timing)
+    if len(timing)!=self.timing_entry_length:
+      sys.exit('Wrong timing entry length %d' % len(timing))
+    self._own()
+    self.clocks.append(clk)
+    self.types.append(type_)
+    self.timings.extend(timing)
+
+  def snapshot(self):
+    """Table with the same entries, the buffers are only copied when one of both is changed"""
+    self.shared=True
+    table=TimingTable(self.timing_entry_length, self.clocks, self.types, self.timings)
+    table.shared=True
+    return table
+
+  def pack_entry(self, id_):
+    #entry as in the bios
+    return struct.pack('<I', self.clocks[id_]+self.types[id_]*0x1000000)+self.timing(id_)
+
+  def pack(self):
+    """All entries as in the bios, without revision, count and terminator"""
+    return b''.join(self.pack_entry(id_) for id_ in xrange(len(self.clocks)))
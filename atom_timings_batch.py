@@ -0,0 +1,182 @@
+import optparse
+import sys
+import os
+import glob
+import json
+import multiprocessing
+from atom_timings_editor import parse_patch_string, BiosImage
+from atom_timings_validate import format_violation
+from atom_profile import Stats, set_active_stats
+
+def iter_inputs(inputs, pattern='*.rom'):
+  #paths one by one, a directory or glob is listed when it is reached
+  for i in inputs:
+    if os.path.isdir(i):
+      for f in sorted(glob.glob(os.path.join(i, pattern))):
+        yield f
+    elif os.path.isfile(i):
+      yield i
+    else:
+      for f in sorted(glob.glob(i)):
+        yield f
+
+def expand_inputs(inputs, pattern='*.rom'):
+  return list(iter_inputs(inputs, pattern))
+
+def load_manifest(f):
+  #one '<input> [<output>]' pair per line, '#' starts a comment
+  jobs=[]
+  for l in f.readlines():
+    l=l.split('#')[0].strip()
+    if not l:
+      continue
+    p=l.split()
+    if len(p)>2:
+      sys.exit('Manifest parser error on "%s"' % l)
+    jobs+=[(p[0], p[1] if len(p)==2 else None)]
+  return jobs
+
+def patch_rom_file(job):
+  input_path, output_path, patches, options=job
+  status={'input': input_path, 'output': output_path, 'bios_version': None, 'type': None, 'entries': None, 'status': 'error', 'message': ''}
+  image=None
+  stats=None
+  if options['stats']:
+    stats=Stats(input=input_path)
+    set_active_stats(stats)
+  try:
+    image=BiosImage.load(input_path, options['mmap'],
+      timing_entry_type=options['timing_entry_type'],
+      timing_entry_length=options['timing_entry_length'],
+      timing_table_offset=options['timing_table_offset'],
+      timing_table_length=options['timing_table_length'],
+      stats=stats)
+
+    bios_version=image.bios_version
+    status['bios_version']=str(bios_version).strip('\0 ') if bios_version is not None else None
+
+    if image.timing_entry_type is None:
+      sys.exit('Could not detect timing entry type')
+    if image.timing_entry_type not in ['R9', 'RX']:
+      sys.exit('Unsupported timing entry type')
+    status['type']=image.timing_entry_type
+
+    if image.timing_table_length==0:
+      sys.exit('Could not find timing table')
+    status['entries']=image.timing_table_length
+
+    image.patch(patches)
+    violations=image.validate()
+    if violations and not options['force']:
+      sys.exit('%d timing rule violations: %s' % (len(violations), '; '.join(format_violation(v) for v in violations)))
+    if output_path is not None:
+      image.write(output_path)
+    status['status']='ok'
+  except SystemExit as e:
+    status['message']=str(e)
+  except Exception as e:
+    status['message']='%s: %s' % (type(e).__name__, e)
+  finally:
+    if image is not None:
+      image.close()
+  if stats is not None:
+    set_active_stats(None)
+    stats.info.update((k, status[k]) for k in ['output', 'bios_version', 'type', 'entries', 'status', 'message'])
+    status['stats']=stats.record()
+  return status
+
+def run_batch(jobs, patches, options, processes=None, chunksize=None):
+  work=[(i, o, patches, options) for i, o in jobs]
+  if processes==1:
+    for w in work:
+      yield patch_rom_file(w)
+    return
+
+  pool=multiprocessing.Pool(processes)
+  try:
+    if chunksize is None:
+      chunksize=max(1, len(work)/(4*(processes or multiprocessing.cpu_count())))
+    for s in pool.imap(patch_rom_file, work, chunksize):
+      yield s
+    pool.close()
+  finally:
+    pool.terminate()
+    pool.join()
+
+def save_batch_report(f, status):
+  print >>f, "%-5s %s %s %s %s %s %s" % (status['status'], status['input'], status['output'] or '-', status['bios_version'] or '-', status['type'] or '-', status['entries'] if status['entries'] is not None else '-', status['message'])
+
+if __name__ == '__main__':
+  parser = optparse.OptionParser(usage="%prog [options] <rom|dir|glob>...")
+  parser.add_option("-m", "--manifest", dest="manifest", help="Manifest file with '<input> [<output>]' per line")
+  parser.add_option("-d", "--outputdir", dest="output_dir", help="Directory for patched bios files (default dry run)")
+  parser.add_option("--pattern", dest="pattern", default="*.rom", help="File pattern used for input directories (default *.rom)")
+  parser.add_option("--report", dest="report", default="-", help="Per-file status report file/stdout (default stdout)")
+  parser.add_option("-j", "--jobs", dest="jobs", default=None, help="Number of worker processes (default number of cpus)")
+  parser.add_option("--offset", dest="timing_table_offset", default=None, help="Timing table offset in bios relative to vram_info_table_offset+usMemClkPatchTblOffset+44 (default autodetect)")
+  parser.add_option("--length", dest="timing_table_length", default=None, help="Number of timings entries in bios to read (default autodetect)")
+  parser.add_option("--elength", dest="timing_entry_length", default=None, help="Lenght of timing string (default autodetect)")
+  parser.add_option("--type", dest="timing_entry_type", default=None, help="Type of timing entriy to decode (default autodetect)")
+  parser.add_option("-p", "--patch", dest="patch", action="append", help="Patch applied to every bios, same syntax as atom_timings_editor.py")
+  parser.add_option("--force", dest="force", action="store_true", default=False, help="Write patched timings even if they break timing rules")
+  parser.add_option("--mmap", dest="mmap", action="store_true", default=False, help="Memory map bios files and write back only changed ranges")
+  parser.add_option("--stats", dest="stats", default=None, help="Write JSON record with time per phase for every bios to file")
+
+  (options, args) = parser.parse_args()
+
+  if not args and options.manifest is None:
+    parser.error("At least one input or option 'manifest' is required")
+  if not options.patch:
+    parser.error("At least one patch is required")
+
+  jobs=[]
+  if options.manifest is not None:
+    with open(options.manifest) as manifest_file:
+      jobs+=load_manifest(manifest_file)
+  jobs+=[(i, None) for i in expand_inputs(args, options.pattern)]
+
+  outputs=set()
+  for n, (i, o) in enumerate(jobs):
+    if o is None and options.output_dir is not None:
+      o=os.path.join(options.output_dir, os.path.basename(i))
+    if o is not None:
+      if o in outputs:
+        sys.exit("Output file '%s' used more than once" % o)
+      outputs.add(o)
+    jobs[n]=(i, o)
+
+  if options.output_dir is not None and not os.path.isdir(options.output_dir):
+    os.makedirs(options.output_dir)
+
+  patches=[parse_patch_string(p) for p in options.patch]
+  batch_options={
+    'timing_table_offset': int(options.timing_table_offset) if options.timing_table_offset is not None else None,
+    'timing_table_length': int(options.timing_table_length) if options.timing_table_length is not None else None,
+    'timing_entry_length': int(options.timing_entry_length) if options.timing_entry_length is not None else None,
+    'timing_entry_type': options.timing_entry_type,
+    'mmap': options.mmap,
+    'force': options.force,
+    'stats': options.stats is not None,
+  }
+  processes=int(options.jobs) if options.jobs is not None else None
+
+  failed=0
+  report=sys.stdout if options.report=='-' else open(options.report, 'w')
+  stats_file=open(options.stats, 'w') if options.stats is not None else None
+  try:
+    for s in run_batch(jobs, patches, batch_options, processes):
+      if s['status']!='ok':
+        failed+=1
+      save_batch_report(report, s)
+      report.flush()
+      if stats_file is not None:
+        print >>stats_file, json.dumps(s['stats'], sort_keys=True)
+  finally:
+    if report is not sys.stdout:
+      report.close()
+    if stats_file is not None:
+      stats_file.close()
+
+  print >>sys.stderr, "%d of %d bios files patched, %d failed" % (len(jobs)-failed, len(jobs), failed)
+  if failed:
+    sys.exit(1)
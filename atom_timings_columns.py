@@ -0,0 +1,118 @@
+import optparse
+import sys
+import os
+import collections
+from atom_rom_timings import require_numpy, strap_matrix, decode_columns
+from atom_timings_editor import BiosImage
+from atom_timings_batch import expand_inputs
+
+#all straps of many roms as columns, the decoding itself is strap_matrix/decode_columns
+
+def decode_roms(paths, errors=None, **kwargs):
+  """{bios type: ordered columns} for all straps of all roms, with rom, bios_version, freq, module and vendor_id columns first,
+  roms that fail are skipped and added to errors as (path, message)"""
+  numpy=require_numpy()
+  straps={}
+  for path in paths:
+    image=None
+    try:
+      image=BiosImage.load(path, True, **kwargs)
+      if image.timing_entry_type not in ['R9', 'RX']:
+        sys.exit('Unsupported timing entry type')
+      bios_version=image.bios_version
+      bios_version=str(bios_version).strip('\0 ') if bios_version is not None else ''
+      vram_modules=image.vram_modules
+      rows=[(path, bios_version, c, t, vram_modules[t].ucMemoryVenderID if t<len(vram_modules) else -1, s) for c, t, s in image.timing_table]
+      straps.setdefault((image.timing_entry_type, image.timing_entry_length), []).extend(rows)
+    except SystemExit as e:
+      if errors is not None:
+        errors+=[(path, str(e))]
+    except Exception as e:
+      if errors is not None:
+        errors+=[(path, '%s: %s' % (type(e).__name__, e))]
+    finally:
+      if image is not None:
+        image.close()
+
+  tables={}
+  for (bios_type, timing_entry_length), rows in sorted(straps.items()):
+    if bios_type in tables:
+      sys.exit('Bioses of type %s with different timing string lengths' % bios_type)
+    rom, bios_version, freq, module, vendor_id, timings=zip(*rows)
+    columns=collections.OrderedDict()
+    columns['rom']=numpy.array(rom)
+    columns['bios_version']=numpy.array(bios_version)
+    columns['freq']=numpy.array(freq, dtype='u4')
+    columns['module']=numpy.array(module, dtype='u1')
+    columns['vendor_id']=numpy.array(vendor_id, dtype='i2')
+    columns.update(decode_columns(bios_type, strap_matrix(timings, timing_entry_length)))
+    tables[bios_type]=columns
+  return tables
+
+def to_structured(columns):
+  numpy=require_numpy()
+  array=numpy.empty(len(columns.values()[0]), dtype=[(name, c.dtype) for name, c in columns.items()])
+  for name, c in columns.items():
+    array[name]=c
+  return array
+
+def save_csv(f, columns):
+  print >>f, ','.join(columns.keys())
+  for row in zip(*[c.tolist() for c in columns.values()]):
+    print >>f, ','.join(map(str, row))
+
+def save_parquet(path, columns):
+  try:
+    import pyarrow
+    import pyarrow.parquet
+  except ImportError:
+    sys.exit('pyarrow is required for parquet output')
+  pyarrow.parquet.write_table(pyarrow.Table.from_arrays([pyarrow.array(c) for c in columns.values()], list(columns.keys())), path)
+
+def save_columns(path, columns):
+  #format by extension: .csv, .npy (structured array) or .parquet
+  ext=os.path.splitext(path)[1]
+  if ext=='.npy':
+    require_numpy().save(path, to_structured(columns))
+  elif ext=='.parquet':
+    save_parquet(path, columns)
+  elif ext=='.csv':
+    with open(path, 'w') as f:
+      save_csv(f, columns)
+  else:
+    sys.exit('Unknown output format %s' % ext)
+
+if __name__ == '__main__':
+  parser = optparse.OptionParser(usage="%prog [options] <rom|dir|glob>...")
+  parser.add_option("-o", "--output", dest="output", default="-", help="Output .csv, .npy or .parquet file, bios type is added to the name if there are several (default csv to stdout)")
+  parser.add_option("--pattern", dest="pattern", default="*.rom", help="File pattern used for input directories (default *.rom)")
+  parser.add_option("--elength", dest="timing_entry_length", default=None, help="Lenght of timing string (default autodetect)")
+  parser.add_option("--type", dest="timing_entry_type", default=None, help="Type of timing entriy to decode (default autodetect)")
+
+  (options, args) = parser.parse_args()
+  if not args:
+    parser.error("At least one input is required")
+  require_numpy()
+
+  paths=expand_inputs(args, options.pattern)
+  errors=[]
+  tables=decode_roms(paths, errors,
+    timing_entry_type=options.timing_entry_type,
+    timing_entry_length=int(options.timing_entry_length) if options.timing_entry_length is not None else None)
+  for path, message in errors:
+    print >>sys.stderr, "%s: %s" % (path, message)
+  if errors:
+    print >>sys.stderr, "%d of %d roms decoded, %d failed" % (len(paths)-len(errors), len(paths), len(errors))
+  if not tables:
+    sys.exit('No straps decoded')
+
+  if options.output=='-' and len(tables)>1:
+    sys.exit('Bioses of several types, use an output file')
+  for bios_type, columns in sorted(tables.items()):
+    if options.output=='-':
+      save_csv(sys.stdout, columns)
+    elif len(tables)>1:
+      base, ext=os.path.splitext(options.output)
+      save_columns('%s.%s%s' % (base, bios_type, ext), columns)
+    else:
+      save_columns(options.output, columns)
@@ -0,0 +1,206 @@
+import optparse
+import sys
+import os
+import json
+import hashlib
+import signal
+import struct
+import traceback
+import threading
+import collections
+import urlparse
+import StringIO
+import SocketServer
+import BaseHTTPServer
+from atom_timings_editor import BiosImage, save_binary_timing_table
+from atom_timings_validate import format_violation
+
+#patch service keeping parsed bioses in memory, requests name a bios by the sha1 of its content
+#
+#  POST /images                    bios in the body, parsed and kept, returns its info
+#  GET  /images                    info of all kept bioses
+#  GET  /images/<sha1>             info of one bios
+#  GET  /images/<sha1>/table       timing table, ?registers=1 for decoded registers, ?format=binary for .attb
+#  POST /images/<sha1>/patch?p=..  patched bios, ?format=table/binary returns the patched table instead
+#  POST /patch?p=..                the same with the bios in the body, it is kept for later requests
+#
+#patches breaking timing rules get 422 with the violations as {id, freq, type, rule, values, message}, ?force=1 writes anyway
+
+class ImageCache(object):
+  """Parsed bioses by sha1 of their content, the least recently used is dropped first"""
+
+  def __init__(self, max_size=16):
+    self.max_size=max_size
+    self.images=collections.OrderedDict()
+    self.lock=threading.Lock()
+
+  def add(self, bios):
+    bios_hash=hashlib.sha1(bios).hexdigest()
+    image=self.get(bios_hash)
+    if image is not None:
+      return bios_hash, image
+    image=BiosImage(bytearray(bios))
+    if image.timing_entry_type not in ['R9', 'RX']:
+      sys.exit('Could not detect timing entry type')
+    if image.timing_table_length==0:
+      sys.exit('Could not find timing table')
+    image.timing_table, image.bios_version, image.vram_modules #parse everything before it is shared
+    with self.lock:
+      self.images[bios_hash]=image
+      while len(self.images)>self.max_size:
+        self.images.popitem(last=False)
+    return bios_hash, image
+
+  def get(self, bios_hash):
+    with self.lock:
+      image=self.images.pop(bios_hash, None)
+      if image is not None:
+        self.images[bios_hash]=image
+      return image
+
+  def items(self):
+    with self.lock:
+      return self.images.items()
+
+def image_info(bios_hash, image):
+  bios_version=image.bios_version
+  return {'hash': bios_hash, 'bios_version': str(bios_version).strip('\0 ') if bios_version is not None else None, 'type': image.timing_entry_type, 'entries': image.timing_table_length, 'size': len(image.bios)}
+
+class PatchRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  protocol_version='HTTP/1.1' #every response has a length, so clients can keep the connection
+  cache=None #ImageCache of the server
+  verbose=False
+
+  def address_string(self):
+    #unix socket clients have no address
+    return self.client_address[0] if self.client_address else 'unix'
+
+  def log_message(self, *args):
+    if self.verbose:
+      BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, *args)
+
+  def log_error(self, *args):
+    #errors are logged without -v too
+    BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, *args)
+
+  def send(self, code, body, content_type='application/octet-stream'):
+    self.send_response(code)
+    self.send_header('Content-Type', content_type)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def send_json(self, code, value):
+    self.send(code, json.dumps(value, sort_keys=True)+'\n', 'application/json')
+
+  def read_body(self):
+    return self.rfile.read(int(self.headers.getheader('Content-Length', 0)))
+
+  def get_image(self, bios_hash):
+    image=self.cache.get(bios_hash)
+    if image is None:
+      self.send_json(404, {'error': 'Unknown bios %s' % bios_hash})
+    return image
+
+  def send_table(self, image, query):
+    f=StringIO.StringIO()
+    if query.get('format', [''])[0]=='binary':
+      save_binary_timing_table(f, image.timing_table, image.timing_entry_type)
+      self.send(200, f.getvalue())
+    else:
+      image.save_timing_table(f, query.get('registers', ['0'])[0]=='1')
+      self.send(200, f.getvalue(), 'text/plain')
+
+  def send_patched(self, image, query):
+    image=image.copy()
+    image.patch(query.get('p', []))
+    violations=image.validate()
+    if violations and query.get('force', ['0'])[0]!='1':
+      self.send_json(422, {'error': '%d timing rule violations' % len(violations), 'violations': [dict(v, message=format_violation(v)) for v in violations]})
+    elif query.get('format', [''])[0] in ['table', 'binary']:
+      self.send_table(image, query)
+    else:
+      self.send(200, bytes(image.serialize()))
+
+  def handle_request(self, method):
+    url=urlparse.urlparse(self.path)
+    path=[p for p in url.path.split('/') if p]
+    query=urlparse.parse_qs(url.query)
+    try:
+      if method=='GET' and path==['images']:
+        self.send_json(200, [image_info(h, i) for h, i in self.cache.items()])
+      elif method=='POST' and path==['images']:
+        self.send_json(200, image_info(*self.cache.add(self.read_body())))
+      elif method=='GET' and len(path)==2 and path[0]=='images':
+        image=self.get_image(path[1])
+        if image is not None:
+          self.send_json(200, image_info(path[1], image))
+      elif method=='GET' and len(path)==3 and path[0]=='images' and path[2]=='table':
+        image=self.get_image(path[1])
+        if image is not None:
+          self.send_table(image, query)
+      elif method=='POST' and len(path)==3 and path[0]=='images' and path[2]=='patch':
+        image=self.get_image(path[1])
+        if image is not None:
+          self.send_patched(image, query)
+      elif method=='POST' and path==['patch']:
+        self.send_patched(self.cache.add(self.read_body())[1], query)
+      else:
+        self.send_json(404, {'error': 'Unknown request %s %s' % (method, url.path)})
+    except SystemExit as e:
+      self.send_json(400, {'error': str(e)})
+    except struct.error as e: #tables point outside of the uploaded bios
+      self.send_json(400, {'error': 'Malformed bios: %s' % e})
+    except Exception as e:
+      self.log_error('%s', traceback.format_exc())
+      self.send_json(500, {'error': '%s: %s' % (type(e).__name__, e)})
+
+  def do_GET(self):
+    self.handle_request('GET')
+
+  def do_POST(self):
+    self.handle_request('POST')
+
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+  daemon_threads=True
+
+class ThreadingUnixHTTPServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+  daemon_threads=True
+
+def make_server(cache, listen='127.0.0.1:8765', unix_socket=None, verbose=False):
+  class handler(PatchRequestHandler):
+    pass
+  handler.cache=cache
+  handler.verbose=verbose
+  if unix_socket is not None:
+    if os.path.exists(unix_socket):
+      os.unlink(unix_socket)
+    return ThreadingUnixHTTPServer(unix_socket, handler)
+  host, port=listen.rsplit(':', 1)
+  return ThreadingHTTPServer((host, int(port)), handler)
+
+if __name__ == '__main__':
+  parser = optparse.OptionParser(usage="%prog [options] [<rom>...]")
+  parser.add_option("-l", "--listen", dest="listen", default="127.0.0.1:8765", help="Address to listen on (default 127.0.0.1:8765)")
+  parser.add_option("-u", "--unix", dest="unix_socket", default=None, help="Listen on unix socket instead")
+  parser.add_option("--cache", dest="cache", default=16, help="Number of parsed bioses kept (default 16)")
+  parser.add_option("-v", "--verbose", dest="verbose", action="store_true", default=False, help="Log requests")
+
+  (options, args) = parser.parse_args()
+
+  cache=ImageCache(int(options.cache))
+  for path in args:
+    with open(path, 'rb') as bios_file:
+      bios_hash, image=cache.add(bios_file.read())
+    print >>sys.stderr, bios_hash, path
+
+  server=make_server(cache, options.listen, options.unix_socket, options.verbose)
+  signal.signal(signal.SIGTERM, lambda *args: sys.exit(0)) #clean up the socket on kill too
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+    if options.unix_socket is not None and os.path.exists(options.unix_socket):
+      os.unlink(options.unix_socket)
@@ -0,0 +1,122 @@
+import optparse
+import sys
+import struct
+import collections
+from atom_rom_timings import register_codecs
+from atom_timings_editor import BiosImage
+from atom_timings_batch import expand_inputs
+from atom_strap_db import strap_hash
+
+#register level differences between bioses, straps are aligned by (type, freq) and kept once per content
+
+def diff_timings(bios_type, a, b):
+  """Changed fields between two timing strings as (name, old, new), words outside the known registers as raw values"""
+  n=len(a)/4
+  words_a, words_b=struct.unpack('<%dI' % n, bytes(a)), struct.unpack('<%dI' % n, bytes(b))
+  registers=dict((offset, (r_name, fields)) for r_name, (offset, fields) in register_codecs[bios_type].items()) if bios_type is not None else {}
+  changes=[]
+  for i in xrange(n):
+    if words_a[i]==words_b[i]: #compare whole registers first, decode only the changed ones
+      continue
+    if i*4 not in registers:
+      changes+=[('0x%02x' % (i*4), words_a[i], words_b[i])]
+      continue
+    r_name, fields=registers[i*4]
+    for name, shift, mask in fields:
+      value_a, value_b=(words_a[i] >> shift) & mask, (words_b[i] >> shift) & mask
+      if value_a!=value_b:
+        changes+=[(name if not name.startswith('unused') else '%s.%s' % (r_name, name), value_a, value_b)]
+  return changes
+
+def format_changes(changes):
+  return ', '.join('%s %d->%d' % c if c[0][0:2]!='0x' else '%s 0x%08x->0x%08x' % c for c in changes)
+
+def format_endpoint(t, c):
+  return '%d:%d (%d MHz)' % (t, c, c/100)
+
+def load_straps(paths, errors=None, **kwargs):
+  """Every bios parsed once: {path: (bios type, {(type, freq): timing string})},
+  bioses that fail are skipped and added to errors as (path, message)"""
+  straps=collections.OrderedDict()
+  for path in paths:
+    image=None
+    try:
+      image=BiosImage.load(path, True, **kwargs)
+      if image.timing_entry_type not in ['R9', 'RX']:
+        sys.exit('Unsupported timing entry type')
+      straps[path]=(image.timing_entry_type, collections.OrderedDict(((t, c), bytes(s)) for c, t, s in image.timing_table))
+    except SystemExit as e:
+      if errors is not None:
+        errors+=[(path, str(e))]
+    except Exception as e:
+      if errors is not None:
+        errors+=[(path, '%s: %s' % (type(e).__name__, e))]
+    finally:
+      if image is not None:
+        image.close()
+  return straps
+
+def diff_two(straps_a, straps_b):
+  """[(type, freq, 'only-a'/'only-b'/'changed', changes)] in table order"""
+  bios_type_a, table_a=straps_a
+  bios_type_b, table_b=straps_b
+  bios_type=bios_type_a if bios_type_a==bios_type_b else None #different layouts compare raw words only
+  diffs=[]
+  for k in list(table_a)+[k for k in table_b if k not in table_a]:
+    if k not in table_b:
+      diffs+=[(k[0], k[1], 'only-a', [])]
+    elif k not in table_a:
+      diffs+=[(k[0], k[1], 'only-b', [])]
+    elif table_a[k]!=table_b[k]:
+      diffs+=[(k[0], k[1], 'changed', diff_timings(bios_type, table_a[k], table_b[k]))]
+  return diffs
+
+def group_straps(straps):
+  """{(type, freq): [(timing string, [paths])]} with the strap most bioses carry first"""
+  groups=collections.OrderedDict()
+  for path, (bios_type, table) in straps.items():
+    for k, s in table.items():
+      groups.setdefault(k, collections.OrderedDict()).setdefault(s, []).append(path)
+  return collections.OrderedDict((k, sorted(v.items(), key=lambda a: -len(a[1]))) for k, v in sorted(groups.items()))
+
+if __name__ == '__main__':
+  parser = optparse.OptionParser(usage="%prog [options] <rom> <rom> | <rom|dir|glob>...")
+  parser.add_option("--pattern", dest="pattern", default="*.rom", help="File pattern used for input directories (default *.rom)")
+  parser.add_option("-v", "--verbose", dest="verbose", action="store_true", default=False, help="List the bioses of every strap")
+  parser.add_option("--elength", dest="timing_entry_length", default=None, help="Lenght of timing string (default autodetect)")
+  parser.add_option("--type", dest="timing_entry_type", default=None, help="Type of timing entriy to decode (default autodetect)")
+
+  (options, args) = parser.parse_args()
+  paths=expand_inputs(args, options.pattern)
+  if len(paths)<2:
+    parser.error("At least two bioses are required")
+
+  errors=[]
+  straps=load_straps(paths, errors, timing_entry_type=options.timing_entry_type,
+    timing_entry_length=int(options.timing_entry_length) if options.timing_entry_length is not None else None)
+  for path, message in errors:
+    print >>sys.stderr, "%s: %s" % (path, message)
+  if errors:
+    print >>sys.stderr, "%d of %d bioses loaded, %d failed" % (len(straps), len(paths), len(errors))
+  if len(straps)<2:
+    sys.exit('At least two bioses are required')
+
+  if len(paths)==2:
+    a, b=straps.keys()
+    for t, c, kind, changes in diff_two(straps[a], straps[b]):
+      if kind=='changed':
+        print '%s: %s' % (format_endpoint(t, c), format_changes(changes))
+      else:
+        print '%s: only in %s' % (format_endpoint(t, c), a if kind=='only-a' else b)
+  else:
+    bios_types=set(bios_type for bios_type, table in straps.values())
+    bios_type=bios_types.pop() if len(bios_types)==1 else None
+    for (t, c), variants in group_straps(straps).items():
+      common, common_paths=variants[0]
+      print '%s: %d straps in %d bioses, %s in %d' % (format_endpoint(t, c), len(variants), sum(len(v[1]) for v in variants), strap_hash(common)[0:8], len(common_paths))
+      if options.verbose:
+        print '  %s %s' % (strap_hash(common)[0:8], ' '.join(common_paths))
+      for s, s_paths in variants[1:]:
+        print '  %s in %d: %s' % (strap_hash(s)[0:8], len(s_paths), format_changes(diff_timings(bios_type, common, s)))
+        if options.verbose:
+          print '  %s %s' % (strap_hash(s)[0:8], ' '.join(s_paths))
@@ -1,26 +1,36 @@
 import optparse
 import sys
 import re
-from construct import *
-from atom_rom import atom_rom_header_ptr, ATOM_ROM_HEADER, fix_bios_checksum, ATOM_VRAM_TIMING_ENTRY, ATOM_MASTER_DATA_TABLE, ATOM_VRAM_INFO_TABLE, get_bios_version
-from atom_rom_timings import format_register_string, set_register_in_string
+import struct
+import collections
+import atexit
+import binascii
+from atom_rom import ATOM_ROM_HEADER, ATOM_MASTER_DATA_TABLE, ATOM_VRAM_INFO_TABLE, ATOM_VRAM_ENTRY, get_bios_version, parse_struct, get_compiled_struct, get_atom_rom_header_offset, write_bios_range, load_bios, map_bios
+from atom_rom_timings import format_register_string, set_register_in_string, lookup_subregister, require_numpy
+from atom_signatures import detect_bios_signature
+from atom_timing_table import TimingTable
+from atom_timings_validate import validate_timing_table, format_violation
+from atom_profile import Stats, phase, count, set_active_stats
 
 def hexify(a):
-  return  "".join("%02x" % int(b) for b in a)
+  return binascii.hexlify(bytes(a))
 
-def parse_patch_string(patch):
-  erx='([0-3]+:[0-9]+00|[0-9]+)' #endpont regex
-  rrx='([A-Z0-9_]+[-+]?=[0-9]+)' #register regex
+patch_endpoint_regex='([0-3*]+:[0-9]+00|[0-9]+)' #endpont regex, type * is every vram module
+patch_register_regex='([A-Z0-9_]+[-+]?=[0-9]+)' #register regex
+patch_regex=re.compile("^(%s(-%s?)?)=%s(\[((%s,)*%s)\])?$" % (patch_endpoint_regex, patch_endpoint_regex, patch_endpoint_regex, patch_register_regex, patch_register_regex))
+patch_change_regex=re.compile('^([A-Z0-9_]+)([-+]?=)([0-9]+)$')
 
+def parse_patch_string(patch):
   def split_endpoint(e):
     if ':' in e:
-      e_=[int(a) for a in e.split(':')]
-      return {'type': e_[0], 'freq': e_[1]}
+      t, f=e.split(':')
+      if '*' in t and t!='*':
+        sys.exit("Could not parse patch string '%s'" % patch)
+      return {'type': t if t=='*' else int(t), 'freq': int(f)}
     else:
       return {'id': int(e)}
 
-  regex_string="^(%s(-%s?)?)=%s(\[((%s,)*%s)\])?$" % (erx, erx, erx, rrx, rrx)
-  m=re.match(regex_string, patch)
+  m=patch_regex.match(patch)
   patch_={}
   if m is not None:
     #destination
@@ -38,54 +48,90 @@ def parse_patch_string(patch):
     if m.group(7) is not None:
       change=[]
       for p in m.group(7).split(','):
-        if '+=' in p:
-          change+=[p.split('+=')+['+=']]
-        if '-=' in p:
-          change+=[p.split('-=')+['-=']]
-        else:
-          change+=[p.split('=')+['=']]
+        r,eqop,v=patch_change_regex.match(p).groups()
+        change+=[[r, int(v), eqop]]
       patch_['change']=change
   else:
     sys.exit("Could not parse patch string '%s'" % patch)
 
   return patch_
 
+text_timing_table_regex=re.compile(' *([0-9]+)00 ([0-9]) ([0-9a-zA-Z]+)')
+
 def load_text_timing_table(f):
-  timing_table=[]
+  entries=[]
   for l in f.readlines():
-    m=re.match(' *([0-9]+)00 ([0-9]) ([0-9a-zA-Z]+)', l)
+    m=text_timing_table_regex.match(l)
     if m:
       c,t,s=m.group(1),m.group(2),m.group(3)
-      timing_table+=[(int(c+'00'),int(t),s)]
+      entries+=[(int(c+'00'),int(t),s.decode("hex"))]
     else:
       sys.exit('Timing table parser error on "%s"' % l)
-  return timing_table
+  return TimingTable.from_entries(entries)
 
 def save_text_timing_table(f, timing_table, registers=False, bios_type=None):
   for c,t,s in timing_table:
-    timing_entry_string="%6s %d %s" % (c, t, s)
+    timing_entry_string="%6s %d %s" % (c, t, hexify(s))
     if registers:
       registers=['MC_SEQ_RAS_TIMING', 'MC_SEQ_CAS_TIMING', 'MC_SEQ_MISC_TIMING', 'MC_SEQ_MISC_TIMING2', 'MC_SEQ_PMG_TIMING', 'MC_ARB_DRAM_TIMING', 'MC_ARB_DRAM_TIMING2']
-      timing_entry_string+=' '+','.join([format_register_string(bios_type, s, r) for r in registers])
+      timing_entry_string+=' '+format_register_string(bios_type, s, registers)
     print >>f, timing_entry_string
 
+#binary timing table: header then entries packed like in the bios (clock with type in the top byte, timing string)
+binary_timing_table_magic='ATTB'
+binary_timing_table_ext='.attb'
+binary_timing_table_header=struct.Struct('<4sBx2sHxxI') #magic, version, bios type, timing entry length, entries
+
+def is_binary_timing_table(f):
+  magic=f.read(len(binary_timing_table_magic))
+  f.seek(-len(magic), 1)
+  return magic==binary_timing_table_magic
+
+def read_binary_timing_table_header(data):
+  """(bios type or None, timing entry length, number of entries) of binary table file content or a map of it"""
+  if len(data)<binary_timing_table_header.size:
+    sys.exit('Binary timing table is truncated')
+  magic, version, bios_type, timing_entry_length, timing_table_length=binary_timing_table_header.unpack_from(data)
+  if magic!=binary_timing_table_magic or version!=1:
+    sys.exit('Not a binary timing table')
+  if len(data)<binary_timing_table_header.size+timing_table_length*(timing_entry_length+4):
+    sys.exit('Binary timing table is truncated')
+  return bios_type.strip('\0') or None, timing_entry_length, timing_table_length
+
+def load_binary_timing_table(f):
+  """(timing table, bios type or None)"""
+  data=f.read()
+  bios_type, timing_entry_length, timing_table_length=read_binary_timing_table_header(data)
+  return TimingTable.from_buffer(data, binary_timing_table_header.size, timing_table_length, timing_entry_length), bios_type
+
+def save_binary_timing_table(f, timing_table, bios_type=None):
+  f.write(binary_timing_table_header.pack(binary_timing_table_magic, 1, bios_type or '', timing_table.timing_entry_length, len(timing_table)))
+  f.write(timing_table.pack())
+
+def binary_timing_table_array(data):
+  """Entries of binary table file content or a map of it as NumPy structured array (clk, timing) without copying, clk keeps the type in the top byte"""
+  numpy=require_numpy()
+  bios_type, timing_entry_length, timing_table_length=read_binary_timing_table_header(data)
+  dtype=numpy.dtype([('clk', '<u4'), ('timing', 'u1', timing_entry_length)])
+  return numpy.frombuffer(data, dtype, timing_table_length, binary_timing_table_header.size)
+
 def detect_timing_table_offset(bios, offset, verbose=False):
-  atom_rom_header_offset=ULInt16("atom_rom_header_offset").parse(bios[atom_rom_header_ptr:atom_rom_header_ptr+2])
+  atom_rom_header_offset=get_atom_rom_header_offset(bios)
 
-  atom_rom_header=ATOM_ROM_HEADER.parse(bios[atom_rom_header_offset:])
+  atom_rom_header=parse_struct(ATOM_ROM_HEADER, bios, atom_rom_header_offset)
   if verbose:
     print "atom_rom_header_offset is", atom_rom_header_offset
     print "atom_rom_header is", atom_rom_header
 
   atom_master_data_table_offset=atom_rom_header.usMasterDataTableOffset
-  atom_master_data_table = ATOM_MASTER_DATA_TABLE.parse(bios[atom_master_data_table_offset:])
+  atom_master_data_table = parse_struct(ATOM_MASTER_DATA_TABLE, bios, atom_master_data_table_offset)
 
   if verbose:
     print "atom_master_data_table_offset is", atom_master_data_table_offset
     print "atom_master_data_table is", atom_master_data_table
 
   atom_vram_info_table_offset=atom_master_data_table.VRAM_Info
-  atom_vram_info_table = ATOM_VRAM_INFO_TABLE.parse(bios[atom_vram_info_table_offset:])
+  atom_vram_info_table = parse_struct(ATOM_VRAM_INFO_TABLE, bios, atom_vram_info_table_offset)
 
   if verbose:
     print "atom_vram_info_table_offset is", atom_vram_info_table_offset
@@ -100,31 +146,367 @@ def detect_timing_table_offset(bios, offset, verbose=False):
 
   return atom_vram_timing_table_offset
 
-def detect_timing_table_length(bios, atom_vram_timing_table_offset, timing_entry_length=0x30, verbose=False):
+def detect_timing_table_length(bios, atom_vram_timing_table_offset, timing_entry_length=0x30, verbose=False, max_length=12*3):
   if verbose:
     print "atom_vram_timing_table_offset is", atom_vram_timing_table_offset
 
   timing_table_length=0
-  for i in xrange(12*3): #yes saw table that long
-    t=ATOM_VRAM_TIMING_ENTRY.parse(bios[atom_vram_timing_table_offset+2+(timing_entry_length+4)*i:])
-    if t.ulClkRange==0:
+  for i in xrange(max(max_length, 12*3)): #yes saw table that long
+    ulClkRange=struct.unpack_from('<I', bios, atom_vram_timing_table_offset+2+(timing_entry_length+4)*i)[0]
+    if ulClkRange==0:
       timing_table_length=i
       break
   return timing_table_length
 
+
+def parse_timing_table(bios, atom_vram_timing_table_offset, timing_table_length, timing_entry_length=0x30):
+  return TimingTable.from_buffer(bios, atom_vram_timing_table_offset+2, timing_table_length, timing_entry_length)
+
+def update_timing_table(bios, atom_vram_timing_table_offset, timing_table, timing_entry_length=0x30):
+  if timing_table.timing_entry_length!=timing_entry_length:
+    sys.exit('Wrong timing entry length %d' % timing_table.timing_entry_length)
+  for i in xrange(len(timing_table)):
+    entry_offset=atom_vram_timing_table_offset+2+(timing_entry_length+4)*i
+    entry_raw=timing_table.pack_entry(i)
+    if bios[entry_offset:entry_offset+len(entry_raw)]!=entry_raw: #only touch changed entries
+      write_bios_range(bios, entry_offset, entry_raw)
+
+def index_timing_table(timing_table):
+  #(freq, type) and type -> id of the last matching entry, like the linear searches used to find
+  index={}
+  for id_, (c, t) in enumerate(zip(timing_table.clocks, timing_table.types)):
+    index[(c, t)]=id_
+    index[t]=id_
+  return index
+
+def find_timing_entry(timing_table, endpoint, index=None):
+  if 'freq' in endpoint:
+    if index is None:
+      index=index_timing_table(timing_table)
+    return index.get((endpoint['freq'], endpoint['type']))
+  elif 'id' in endpoint:
+    if endpoint['id']<len(timing_table):
+      return endpoint['id']
+    return None
+  sys.exit("Could not decode entry id")
+
+def check_patch_registers(patch, timing_entry_type):
+  for rfix in patch.get('change', []):
+    lookup_subregister(timing_entry_type, rfix[0])
+
+def patch_endpoints(patch):
+  return [patch[k] for k in ['src', 'dest_start', 'dest_end'] if patch.get(k) is not None]
+
+def expand_module_patches(timing_table, patches, index=None):
+  #a patch with type * becomes one patch per vram module having all its entries
+  if index is None:
+    index=index_timing_table(timing_table)
+  expanded=[]
+  for patch in patches:
+    if not any(e.get('type')=='*' for e in patch_endpoints(patch)):
+      expanded+=[patch]
+      continue
+    module_patches=[]
+    for t in sorted(set(timing_table.types)):
+      patch_=dict((k, dict(v, type=t) if isinstance(v, dict) and v.get('type')=='*' else v) for k, v in patch.items())
+      if all(find_timing_entry(timing_table, e, index) is not None for e in patch_endpoints(patch_)):
+        module_patches+=[patch_]
+    if not module_patches:
+      sys.exit("Could not find patch entries in any vram module")
+    expanded+=module_patches
+  return expanded
+
+def compile_patches(timing_table, patches, timing_entry_type, baselines=None):
+  #resolve patches in order and merge them into one list of (entry id, final timing string)
+  #baselines gets {entry id: unchanged strap it was copied from} to validate copies against their source
+  index=index_timing_table(timing_table)
+  patches=expand_module_patches(timing_table, patches, index)
+  for patch in patches:
+    check_patch_registers(patch, timing_entry_type)
+
+  new_timings={}
+  for patch in patches:
+    id_src=find_timing_entry(timing_table, patch['src'], index)
+    if id_src is None:
+      sys.exit("Could not find source entry id")
+
+    id_dest_start=find_timing_entry(timing_table, patch['dest_start'], index)
+    if id_dest_start is None:
+      sys.exit("Could not find start destination entry id")
+
+    id_dest_end=None
+    if 'dest_end' not in patch:
+      id_dest_end=id_dest_start
+    elif patch['dest_end'] is None:
+      if 'freq' in patch['dest_start']:
+        id_dest_end=index.get(patch['dest_start']['type'])
+      elif 'id' in patch['dest_start']:
+        id_dest_end=len(timing_table)-1
+    else:
+      id_dest_end=find_timing_entry(timing_table, patch['dest_end'], index)
+      if id_dest_end is None:
+        sys.exit("Could not find end destination entry id")
+
+    src_type=timing_table.types[id_src]
+    src_parsed_timings=bytes(new_timings.get(id_src, timing_table.timing(id_src)))
+    src_baseline=baselines.get(id_src, bytes(timing_table.timing(id_src))) if baselines is not None else None
+    for id_ in xrange(id_dest_start, id_dest_end+1):
+      if timing_table.types[id_]==src_type: #same type
+        if baselines is not None:
+          baselines[id_]=src_baseline
+        timing=bytearray(src_parsed_timings)
+        for rfix in patch.get('change', []):
+          set_register_in_string(timing_entry_type, rfix[0], rfix[1], rfix[2], timing)
+        new_timings[id_]=timing
+
+  return sorted(new_timings.items())
+
+def apply_patch_plan(timing_table, plan):
+  for id_, timing in plan:
+    timing_table.set_timing(id_, timing)
+
+def apply_patches(timing_table, patches, timing_entry_type, baselines=None):
+  apply_patch_plan(timing_table, compile_patches(timing_table, patches, timing_entry_type, baselines))
+
+class lazy_property(object):
+  #computed on first access and then stored in the instance, so later reads are plain attribute reads
+  def __init__(self, f):
+    self.f=f
+    self.__name__=f.__name__
+    self.__doc__=f.__doc__
+
+  def __get__(self, obj, cls):
+    if obj is None:
+      return self
+    value=obj.__dict__[self.__name__]=self.f(obj)
+    return value
+
+class BiosImage(object):
+  """Bios loaded once, with its tables parsed on first use and cached"""
+
+  def __init__(self, bios, timing_entry_type=None, timing_entry_length=None, timing_table_offset=None, timing_table_length=None, path=None, verbose=False, stats=None):
+    #layout arguments left at None are taken from the bios signature
+    self.bios=bios
+    self.path=path
+    self.verbose=verbose
+    self.stats=stats
+    self.patch_baselines={} #{entry id: strap it was copied from as loaded}
+    if timing_entry_length is not None:
+      self.timing_entry_length=timing_entry_length
+    if timing_table_offset is not None:
+      self.relative_timing_table_offset=timing_table_offset
+    if timing_entry_type is not None:
+      self.timing_entry_type=timing_entry_type
+    if timing_table_length is not None:
+      self.timing_table_length=timing_table_length
+
+  @classmethod
+  def load(cls, path, use_mmap=False, **kwargs):
+    with phase(kwargs.get('stats'), 'load'):
+      if use_mmap:
+        bios=map_bios(path)
+      else:
+        bios=load_bios(path)
+    count(kwargs.get('stats'), 'bios_bytes', len(bios))
+    return cls(bios, path=path, **kwargs)
+
+  @classmethod
+  def from_timing_table(cls, timing_table, timing_entry_type=None, stats=None):
+    """Image of a timing table without bios, for patching and validating tables loaded from files"""
+    image=cls(None, stats=stats)
+    image.timing_table=timing_table
+    image.timing_entry_type=timing_entry_type #None is kept, there is no bios to detect it from
+    return image
+
+  @property
+  def mmap(self):
+    return not isinstance(self.bios, bytearray)
+
+  def close(self):
+    if self.mmap:
+      self.bios.close()
+
+  @lazy_property
+  def bios_version(self):
+    with phase(self.stats, 'version_detection'):
+      return get_bios_version(self.bios)
+
+  @lazy_property
+  def signature(self):
+    with phase(self.stats, 'type_detection'):
+      return detect_bios_signature(self.bios)
+
+  @lazy_property
+  def timing_entry_type(self):
+    return self.signature[2] if self.signature is not None else None
+
+  @lazy_property
+  def timing_entry_length(self):
+    return self.signature[3] if self.signature is not None else 0x30
+
+  @lazy_property
+  def relative_timing_table_offset(self):
+    return self.signature[4] if self.signature is not None else 0
+
+  @lazy_property
+  def atom_rom_header_offset(self):
+    return get_atom_rom_header_offset(self.bios)
+
+  @lazy_property
+  def atom_rom_header(self):
+    with phase(self.stats, 'offset_detection'):
+      atom_rom_header=parse_struct(ATOM_ROM_HEADER, self.bios, self.atom_rom_header_offset)
+    if self.verbose:
+      print "atom_rom_header_offset is", self.atom_rom_header_offset
+      print "atom_rom_header is", atom_rom_header
+    return atom_rom_header
+
+  @lazy_property
+  def atom_master_data_table(self):
+    atom_master_data_table_offset=self.atom_rom_header.usMasterDataTableOffset
+    with phase(self.stats, 'offset_detection'):
+      atom_master_data_table=parse_struct(ATOM_MASTER_DATA_TABLE, self.bios, atom_master_data_table_offset)
+    if self.verbose:
+      print "atom_master_data_table_offset is", atom_master_data_table_offset
+      print "atom_master_data_table is", atom_master_data_table
+    return atom_master_data_table
+
+  @lazy_property
+  def atom_vram_info_table(self):
+    atom_vram_info_table_offset=self.atom_master_data_table.VRAM_Info
+    with phase(self.stats, 'offset_detection'):
+      atom_vram_info_table=parse_struct(ATOM_VRAM_INFO_TABLE, self.bios, atom_vram_info_table_offset)
+    if self.verbose:
+      print "atom_vram_info_table_offset is", atom_vram_info_table_offset
+      print "atom_vram_info_table is", atom_vram_info_table
+    return atom_vram_info_table
+
+  @lazy_property
+  def vram_modules(self):
+    #modules follow the vram info table, the type byte of a timing entry is the module index
+    offset=self.atom_master_data_table.VRAM_Info+get_compiled_struct(ATOM_VRAM_INFO_TABLE)[0].size
+    entry_size=get_compiled_struct(ATOM_VRAM_ENTRY)[0].size
+    vram_modules=[]
+    with phase(self.stats, 'offset_detection'):
+      for i in xrange(self.atom_vram_info_table.ucNumOfVRAMModule):
+        if offset+entry_size>len(self.bios):
+          break
+        vram_module=parse_struct(ATOM_VRAM_ENTRY, self.bios, offset)
+        vram_modules+=[vram_module]
+        if vram_module.usModuleSize==0:
+          break
+        offset+=vram_module.usModuleSize
+    return vram_modules
+
+  @lazy_property
+  def timing_table_offset(self):
+    return self.atom_master_data_table.VRAM_Info+self.atom_vram_info_table.usMemClkPatchTblOffset+0x2c+self.relative_timing_table_offset #entries starts 2 bytes later
+
+  @lazy_property
+  def timing_table_length(self):
+    timing_table_offset=self.timing_table_offset
+    #tables of several modules can be longer than 36 entries, but not longer than the vram info table
+    atom_vram_info_table_end=self.atom_master_data_table.VRAM_Info+self.atom_vram_info_table.sHeader.usStructureSize
+    max_length=(min(atom_vram_info_table_end, len(self.bios))-timing_table_offset-2-4)/(self.timing_entry_length+4)+1 #entries and the terminating clock
+    with phase(self.stats, 'length_detection'):
+      return detect_timing_table_length(self.bios, timing_table_offset, self.timing_entry_length, self.verbose, max_length)
+
+  @lazy_property
+  def timing_table(self):
+    timing_table_offset, timing_table_length=self.timing_table_offset, self.timing_table_length
+    count(self.stats, 'straps', timing_table_length)
+    with phase(self.stats, 'table_parse'):
+      return parse_timing_table(self.bios, timing_table_offset, timing_table_length, self.timing_entry_length)
+
+  @lazy_property
+  def original_timing_table(self):
+    """Timing table before the first patch, changed entries are validated against it"""
+    return self.timing_table.snapshot()
+
+  @lazy_property
+  def module_straps(self):
+    """{vram module index: ids of its timing table entries}, every module of vram_modules is present"""
+    module_straps=collections.OrderedDict((i, []) for i in xrange(len(self.vram_modules)))
+    for id_, t in enumerate(self.timing_table.types):
+      module_straps.setdefault(t, []).append(id_)
+    return module_straps
+
+  def copy(self):
+    """Image sharing the bios and parsed headers with a copy on write snapshot of the timing table"""
+    image=BiosImage.__new__(BiosImage)
+    image.__dict__.update(self.__dict__)
+    if 'timing_table' in self.__dict__:
+      image.timing_table=self.timing_table.snapshot()
+    image.patch_baselines=dict(self.patch_baselines)
+    return image
+
+  def patch(self, patches):
+    """Apply patch strings or parsed patches to the timing table"""
+    if isinstance(patches, basestring):
+      patches=[patches]
+    timing_table, timing_entry_type=self.timing_table, self.timing_entry_type
+    self.original_timing_table
+    with phase(self.stats, 'patch'):
+      patches=[parse_patch_string(p) if isinstance(p, basestring) else p for p in patches]
+      count(self.stats, 'patches', len(patches))
+      apply_patches(timing_table, patches, timing_entry_type, self.patch_baselines)
+    return self
+
+  def validate(self, rules=None):
+    """Timing rule violations of entries changed by patches"""
+    timing_table, timing_entry_type=self.timing_table, self.timing_entry_type
+    with phase(self.stats, 'validate'):
+      return validate_timing_table(timing_entry_type, timing_table, self.original_timing_table, rules, self.patch_baselines)
+
+  def save_timing_table(self, f, registers=False):
+    timing_table, timing_entry_type=self.timing_table, self.timing_entry_type
+    with phase(self.stats, 'table_output'):
+      save_text_timing_table(f, timing_table, registers, timing_entry_type)
+
+  def update(self, bios):
+    #changed entries are written with write_bios_range, which keeps the checksum by their byte delta
+    timing_table_offset, timing_table=self.timing_table_offset, self.timing_table
+    with phase(self.stats, 'table_update'):
+      update_timing_table(bios, timing_table_offset, timing_table, self.timing_entry_length)
+
+  def serialize(self):
+    """New bios with the current timing table and fixed checksum"""
+    bios=bytearray(self.bios)
+    self.update(bios)
+    return bios
+
+  def write(self, path):
+    if self.mmap and self.path is not None:
+      with phase(self.stats, 'write'):
+        bios=map_bios(self.path, path)
+      self.update(bios)
+      with phase(self.stats, 'write'):
+        bios.flush()
+        bios.close()
+    else:
+      bios=self.serialize()
+      with phase(self.stats, 'write'):
+        with open(path, 'wb') as new_bios_file:
+          new_bios_file.write(bios)
+
 if __name__ == '__main__':
   parser = optparse.OptionParser()
   parser.add_option("-i", "--input", dest="input", help="Input bios file")
   parser.add_option("-o", "--output", dest="output", help="Output bios file")
-  parser.add_option("-I", "--inputtable", dest="input_table", help="Input timings table file in format <freq> <type> <timings>")
-  parser.add_option("-O", "--outputtable", dest="output_table", help="Output timings table file/stdout in format <freq> <type> <timings>")
+  parser.add_option("-I", "--inputtable", dest="input_table", help="Input timings table file in format <freq> <type> <timings> or binary table")
+  parser.add_option("-O", "--outputtable", dest="output_table", help="Output timings table file/stdout in format <freq> <type> <timings>, binary table if the file name ends with .attb")
   parser.add_option("-v", "--verbose", dest="verbose", action="store_true", default=False, help="Be verbose")
-  parser.add_option("--offset", dest="timing_table_offset", default=0, help="Timing table offset in bios relative to vram_info_table_offset+usMemClkPatchTblOffset+44 (default 0)")
+  parser.add_option("--offset", dest="timing_table_offset", default=None, help="Timing table offset in bios relative to vram_info_table_offset+usMemClkPatchTblOffset+44 (default autodetect)")
   parser.add_option("--length", dest="timing_table_length", default=None, help="Number of timings entries in bios to read (default autodetect)")
-  parser.add_option("--elength", dest="timing_entry_length", default=None, help="Lenght of timing string")
+  parser.add_option("--elength", dest="timing_entry_length", default=None, help="Lenght of timing string (default autodetect)")
   parser.add_option("--type", dest="timing_entry_type", default=None, help="Type of timing entriy to decode (default autodetect)")
   parser.add_option("-p", "--patch", dest="patch", action="append", help="Copy timings from given frequency to all higher")
+  parser.add_option("--modules", dest="modules", action="store_true", default=False, help="List vram modules as <type> <ucMemoryVenderID> <ucMemoryType> <freqs of its timings>")
   parser.add_option("-r", "--registers", dest="registers", action="store_true", default=False, help="Show/use timing registers in patch/inputtable/outputtable")
+  parser.add_option("--force", dest="force", action="store_true", default=False, help="Write patched timings even if they break timing rules")
+  parser.add_option("--mmap", dest="mmap", action="store_true", default=False, help="Memory map bios files and write back only changed ranges")
+  parser.add_option("--stats", dest="stats", default=None, help="Write JSON record with time per phase to file/stdout")
+  parser.add_option("--profile", dest="profile", default=None, help="Write cProfile statistics to file")
 
   (options, args) = parser.parse_args()
 
@@ -136,167 +518,111 @@ if __name__ == '__main__':
     parser.error("Option 'output' works only if option 'input'")
 
   timing_entry_type=options.timing_entry_type
+  image=None
+
+  stats=None
+  if options.stats is not None:
+    stats=Stats(input=options.input or options.input_table)
+    set_active_stats(stats)
+    def save_stats():
+      if image is not None and image.bios is not None:
+        bios_version=image.__dict__.get('bios_version')
+        stats.info.update(bios_version=str(bios_version).strip('\0 ') if bios_version is not None else None, type=image.__dict__.get('timing_entry_type'), entries=image.__dict__.get('timing_table_length'))
+      if options.stats=='-':
+        stats.save(sys.stdout)
+      else:
+        with open(options.stats, 'w') as f:
+          stats.save(f)
+    atexit.register(save_stats)
+
+  if options.profile is not None:
+    import cProfile
+    profiler=cProfile.Profile()
+    def save_profile():
+      profiler.disable()
+      profiler.dump_stats(options.profile)
+    atexit.register(save_profile)
+    profiler.enable()
 
   if options.input is not None:
-    bios=None
-    with open(options.input) as bios_file:
-      if options.verbose:
-        print "Reading bios form %s" % options.input
-      bios = bytearray(bios_file.read())
-    if bios is None:
-      sys.exit('Could not load bios')
-
-    bios_version=get_bios_version(bios)
+    if options.verbose:
+      print "Reading bios form %s" % options.input
+    image=BiosImage.load(options.input, options.mmap,
+      timing_entry_type=options.timing_entry_type,
+      timing_entry_length=int(options.timing_entry_length) if options.timing_entry_length is not None else None,
+      timing_table_offset=int(options.timing_table_offset) if options.timing_table_offset is not None else None,
+      timing_table_length=int(options.timing_table_length) if options.timing_table_length is not None else None,
+      verbose=options.verbose,
+      stats=stats)
+
+    bios_version=image.bios_version #signature detection does not need it, read for the --stats record like batch
+    timing_entry_type=image.timing_entry_type
     if timing_entry_type is None:
-
-      #autodetect hacks
-      if bios_version is None:
-        sys.exit('Could not detect timing entry type')
-      if bios_version[0:6] in ['015.04', '015.03', '015.02', '015.01', '015.00']:
-        timing_entry_type='R9'
-      elif bios_version[0:6] in ['015.05']:
-        timing_entry_type='RX'
-      elif bios[0:1024].find('GV-R938XG1 GAMING-4GD/F2/0347') == -1:
-        timing_entry_type='R9'
-      elif bios[0:1024].find('113-C3340400-101.TURKS.PCI_EXPRESS.GDDR5') == -1:
-        timing_entry_type='R9'
-      else:
-        sys.exit('Could not detect timing entry type')
-
+      sys.exit('Could not detect timing entry type')
     if timing_entry_type not in ['R9', 'RX']:
       sys.exit('Unsupported timing entry type')
 
     if options.verbose:
       print 'Using timing entry type', timing_entry_type
 
-    if options.timing_entry_length is None:
-      timing_entry_length=0x30
-    else:
-      timing_entry_length=int(options.timing_entry_length)
-
-    ATOM_VRAM_TIMING_ENTRY=Struct("ATOM_VRAM_TIMING_ENTRY",
-      ULInt32("ulClkRange"), #24 bit clock and 8 bit type
-      Bytes("ucLatency", timing_entry_length)
-    )
-
-    atom_vram_timing_table_offset=detect_timing_table_offset(bios, int(options.timing_table_offset), options.verbose)
-    if options.timing_table_length is None:
-      timing_table_length=detect_timing_table_length(bios, atom_vram_timing_table_offset, timing_entry_length, options.verbose)
-    else:
-      timing_table_length=int(options.timing_table_length)
-
-    ATOM_VRAM_TIMING_TABLE=Struct("ATOM_VRAM_TIMING_TABLE",
-      ULInt8("ucRevId"),
-      ULInt8("ucNumEntries"),
-      Array(lambda ctx: timing_table_length, ATOM_VRAM_TIMING_ENTRY)
-    )
-
-    tt=ATOM_VRAM_TIMING_TABLE.parse(bios[atom_vram_timing_table_offset:])
-    parsed_timing_table=[]
-    for i in xrange(timing_table_length):
-      clck=tt.ATOM_VRAM_TIMING_ENTRY[i].ulClkRange
-      parsed_timing_table+=[[clck & 0xffffff, (clck & 0xff000000) >> 24, hexify(bytearray(tt.ATOM_VRAM_TIMING_ENTRY[i].ucLatency))]]
+    if options.modules:
+      vram_modules=image.vram_modules
+      for t, ids in image.module_straps.items():
+        vram_module=vram_modules[t] if t<len(vram_modules) else None
+        print "%d %s %s %s" % (t, '0x%02x' % vram_module.ucMemoryVenderID if vram_module is not None else '-', '0x%02x' % vram_module.ucMemoryType if vram_module is not None else '-', ','.join(str(image.timing_table.clocks[i]) for i in ids) or '-')
 
   if options.input_table is not None:
-    with open(options.input_table) as timing_table_file:
+    parsed_timing_table=None
+    with open(options.input_table, 'rb') as timing_table_file:
       if options.verbose:
         print "Reading timing table from %s" % options.input_table
-      parsed_timing_table=load_text_timing_table(timing_table_file)
+      with phase(stats, 'table_input'):
+        if is_binary_timing_table(timing_table_file):
+          parsed_timing_table, binary_timing_entry_type=load_binary_timing_table(timing_table_file)
+          if timing_entry_type is None:
+            timing_entry_type=binary_timing_entry_type
+        else:
+          parsed_timing_table=load_text_timing_table(timing_table_file)
     if parsed_timing_table is None:
       sys.exit('Could not load timing table')
+    image=BiosImage.from_timing_table(parsed_timing_table, timing_entry_type, stats)
 
   if options.verbose:
+    timing_table=image.timing_table #parsed before the message, detection prints its own
     print "Readed timing table"
-    save_text_timing_table(sys.stdout, parsed_timing_table)
-
-  new_parsed_timing_table=list(parsed_timing_table)
+    save_text_timing_table(sys.stdout, timing_table)
 
   if options.patch:
-    for p in options.patch:
-      p_=parse_patch_string(p)
-
-      id_src=None
-      if 'freq' in p_['src']:
-        for id_, t in enumerate(new_parsed_timing_table):
-          if t[0]==p_['src']['freq'] and t[1]==p_['src']['type']:
-            id_src=id_
-      elif 'id' in p_['src']:
-        if p_['src']['id']<len(new_parsed_timing_table):
-          id_src=p_['src']['id']
-      else:
-        sys.exit("Could not decode source entry id")
-      if id_src is None:
-        sys.exit("Could not find source entry id")
-
-      id_dest_start=None
-      if 'freq' in p_['dest_start']:
-        for id_, t in enumerate(new_parsed_timing_table):
-          if t[0]==p_['dest_start']['freq'] and t[1]==p_['dest_start']['type']:
-            id_dest_start=id_
-      elif 'id' in p_['dest_start']:
-        if p_['dest']['id']<len(new_parsed_timing_table):
-          id_dest_start=p_['dest_start']['id']
-      else:
-        sys.exit("Could not decode start destination entry id")
-      if id_dest_start is None:
-        sys.exit("Could not find start destination entry id")
-
-      id_dest_end=None
-      if 'dest_end' not in p_:
-        id_dest_end=id_dest_start
-      elif p_['dest_end'] is None:
-        if 'freq' in p_['dest_start']:
-          for id_, t in enumerate(new_parsed_timing_table):
-            if t[1]==p_['dest_start']['type']:
-              id_dest_end=id_
-        elif 'id' in p_['dest_start']:
-          id_dest_end=len(new_parsed_timing_table)-1
-      else:
-        if 'freq' in p_['dest_end']:
-          for id_, t in enumerate(new_parsed_timing_table):
-            if t[0]==p_['dest_end']['freq'] and t[1]==p_['dest_end']['type']:
-              id_dest_end=id_
-        elif 'id' in p_['dest_end']:
-          if p_['dest']['id']<len(new_parsed_timing_table):
-            id_dest_end=p_['dest_end']['id']
-        else:
-          sys.exit("Could not decode end destination entry id")
-        if id_dest_end is None:
-          sys.exit("Could not find end destination entry id")
-
-      src_parsed_timings=new_parsed_timing_table[id_src][2]
-      for id_ in xrange(len(new_parsed_timing_table)):
-        if id_>=id_dest_start and id_<=id_dest_end and new_parsed_timing_table[id_][1]==new_parsed_timing_table[id_src][1]: #same type
-          new_parsed_timing_table[id_][2]=src_parsed_timings
-          if 'change' in p_ and options.registers is not None:
-            for rfix in p_['change']:
-              new_parsed_timing_table[id_][2]=set_register_in_string(timing_entry_type, rfix[0], rfix[1], rfix[2], new_parsed_timing_table[id_][2])
+    image.patch(options.patch)
+    violations=[]
+    if timing_entry_type is None: #plain strap copies of a table without bios type
+      print >>sys.stderr, "Timing rules not checked, use --type to validate"
+    else:
+      violations=image.validate()
+    for v in violations:
+      print >>sys.stderr, format_violation(v)
+    if violations and not options.force:
+      sys.exit('%d timing rule violations, use --force to write anyway' % len(violations))
 
   if options.verbose:
     print "New timing table"
-    save_text_timing_table(sys.stdout, new_parsed_timing_table, options.registers, timing_entry_type)
+    image.save_timing_table(sys.stdout, options.registers)
 
   if options.output_table:
     if options.verbose:
       print "Writing timing table to %s" % options.output_table
 
     if options.output_table=='-':
-      save_text_timing_table(sys.stdout, new_parsed_timing_table, options.registers, timing_entry_type)
+      image.save_timing_table(sys.stdout, options.registers)
+    elif options.output_table.endswith(binary_timing_table_ext):
+      with phase(stats, 'table_output'):
+        with open(options.output_table, 'wb') as f:
+          save_binary_timing_table(f, image.timing_table, timing_entry_type)
     else:
       with open(options.output_table, 'w') as f:
-        save_text_timing_table(f, new_parsed_timing_table, options.registers, timing_entry_type)
+        image.save_timing_table(f, options.registers)
 
   if options.output is not None:
-    if bios is None:
-      sys.exit('Could not output bios file')
-    for i in xrange(len(new_parsed_timing_table)):
-      tt.ATOM_VRAM_TIMING_ENTRY[i].ucLatency=new_parsed_timing_table[i][2].decode("hex")
-      tt.ATOM_VRAM_TIMING_ENTRY[i].ulClkRange=new_parsed_timing_table[i][0]+new_parsed_timing_table[i][1]*0x1000000
-    tt_raw=ATOM_VRAM_TIMING_TABLE.build(tt)
-    bios[atom_vram_timing_table_offset:atom_vram_timing_table_offset+len(tt_raw)]=tt_raw
-
-    fix_bios_checksum(bios)
-    with open(options.output, 'w') as new_bios_file:
-      if options.verbose:
-        print "Writing bios to %s" % options.output
-      new_bios_file.write(bios)
+    if options.verbose:
+      print "Writing bios to %s" % options.output
+    image.write(options.output)
@@ -0,0 +1,121 @@
+import optparse
+import sys
+import json
+import itertools
+import collections
+import multiprocessing
+from atom_rom_timings import decode_fields, hexify
+from atom_timings_editor import BiosImage
+from atom_timings_batch import iter_inputs
+
+#one JSON object per strap for any number of bioses, a bios is read, written out and dropped before the next one
+
+def encode_fields(fields):
+  #subregister names are plain identifiers, so the object is formatted directly
+  return '{'+','.join('"%s":%d' % f for f in fields)+'}'
+
+def error_line(path, message):
+  return json.dumps(collections.OrderedDict([('rom', path), ('error', message)]), separators=(',', ':'))
+
+def encode_bios(job):
+  """JSON lines of all straps of one bios, or one line with the error"""
+  path, kwargs=job
+  image=None
+  try:
+    image=BiosImage.load(path, True, **kwargs)
+    bios_version=image.bios_version
+    bios_version=str(bios_version).strip('\0 ') if bios_version is not None else None
+    bios_type=image.timing_entry_type
+    if bios_type is None:
+      sys.exit('Could not detect timing entry type')
+    if bios_type not in ['R9', 'RX']:
+      sys.exit('Unsupported timing entry type')
+    if image.timing_table_length==0:
+      sys.exit('Could not find timing table')
+    vram_modules=image.vram_modules
+    #keys of the bios are the same for every strap and encoded once
+    prefix='{"rom":%s,"bios_version":%s,"bios_type":%s,' % (json.dumps(path), json.dumps(bios_version), json.dumps(bios_type))
+    lines=[]
+    for id_, (c, t, s) in enumerate(image.timing_table):
+      vendor_id=vram_modules[t].ucMemoryVenderID if t<len(vram_modules) else 'null'
+      lines+=[prefix+'"id":%d,"clk":%d,"type":%d,"vendor_id":%s,"strap":"%s","fields":%s}' % (id_, c, t, vendor_id, hexify(s), encode_fields(decode_fields(bios_type, s)))]
+    return lines
+  except SystemExit as e:
+    return [error_line(path, str(e))]
+  except Exception as e:
+    return [error_line(path, '%s: %s' % (type(e).__name__, e))]
+  finally:
+    if image is not None:
+      image.close()
+
+def iter_encoded(paths, kwargs, processes=1, window=64):
+  """JSON lines per bios in input order, at most window bioses are queued in workers"""
+  jobs=((path, kwargs) for path in paths)
+  if processes==1:
+    for job in jobs:
+      yield encode_bios(job)
+    return
+
+  pool=multiprocessing.Pool(processes)
+  try:
+    while True:
+      chunk=list(itertools.islice(jobs, window)) #Pool.imap would read all paths ahead and keep every result
+      if not chunk:
+        break
+      for lines in pool.imap(encode_bios, chunk):
+        yield lines
+    pool.close()
+  finally:
+    pool.terminate()
+    pool.join()
+
+def write_ndjson(f, encoded, batch_size=1000):
+  """Write JSON lines, flushed every batch_size lines, returns (bioses, lines)"""
+  batch=[]
+  bioses=0
+  lines=0
+  for bios_lines in encoded:
+    bioses+=1
+    batch+=bios_lines
+    if len(batch)>=batch_size:
+      f.write('\n'.join(batch)+'\n')
+      f.flush()
+      lines+=len(batch)
+      batch=[]
+  if batch:
+    f.write('\n'.join(batch)+'\n')
+    f.flush()
+    lines+=len(batch)
+  return bioses, lines
+
+def iter_stdin_paths(f):
+  for l in f:
+    l=l.strip()
+    if l:
+      yield l
+
+if __name__ == '__main__':
+  parser = optparse.OptionParser(usage="%prog [options] <rom|dir|glob|->...")
+  parser.add_option("-o", "--output", dest="output", default="-", help="Output file/stdout (default stdout)")
+  parser.add_option("--pattern", dest="pattern", default="*.rom", help="File pattern used for input directories (default *.rom)")
+  parser.add_option("-b", "--batch", dest="batch", default=1000, help="Lines written per flush (default 1000)")
+  parser.add_option("-j", "--jobs", dest="jobs", default=1, help="Number of worker processes (default 1)")
+  parser.add_option("--elength", dest="timing_entry_length", default=None, help="Lenght of timing string (default autodetect)")
+  parser.add_option("--type", dest="timing_entry_type", default=None, help="Type of timing entriy to decode (default autodetect)")
+
+  (options, args) = parser.parse_args()
+  if not args:
+    parser.error("At least one input is required, - reads paths from stdin")
+
+  paths=itertools.chain.from_iterable(iter_stdin_paths(sys.stdin) if a=='-' else iter_inputs([a], options.pattern) for a in args)
+  kwargs={
+    'timing_entry_type': options.timing_entry_type,
+    'timing_entry_length': int(options.timing_entry_length) if options.timing_entry_length is not None else None,
+  }
+  encoded=iter_encoded(paths, kwargs, int(options.jobs))
+  if options.output=='-':
+    bioses, lines=write_ndjson(sys.stdout, encoded, int(options.batch))
+  else:
+    with open(options.output, 'w') as f:
+      bioses, lines=write_ndjson(f, encoded, int(options.batch))
+  print >>sys.stderr, "%d records of %d bioses written" % (lines, bioses)
@@ -0,0 +1,184 @@
+import optparse
+import sys
+import os
+import re
+import itertools
+import multiprocessing
+from atom_rom import write_bios_range
+from atom_timings_editor import parse_patch_string, compile_patches, BiosImage
+from atom_timings_validate import validate_timings, format_violation
+
+#grid of variants of one base bios, every variant is a patch plan written over the base bytes with an incremental checksum
+
+sweep_change_regex=re.compile('^([A-Z0-9_]+)([-+]?=)([0-9./:]+)$')
+sweep_values_regex=re.compile('^([0-9]+)\.\.([0-9]+)(:([0-9]+))?$')
+
+def parse_sweep_values(values):
+  #N, A/B/C or A..B[:STEP] with B included
+  m=sweep_values_regex.match(values)
+  if m is not None:
+    start, stop, step=int(m.group(1)), int(m.group(2)), int(m.group(4) or 1)
+    if step==0 or stop<start:
+      sys.exit("Wrong sweep range '%s'" % values)
+    return range(start, stop+1, step)
+  if re.match('^[0-9]+(/[0-9]+)*$', values) is None:
+    sys.exit("Could not parse sweep values '%s'" % values)
+  return [int(v) for v in values.split('/')]
+
+def parse_sweep_string(sweep):
+  """Patch string with value ranges for registers, returns (patch string without registers, [(name, eqop, values)])"""
+  m=re.match('^([^\[]*)(\[(.*)\])?$', sweep)
+  if m is None or m.group(3) is None:
+    sys.exit("Could not parse sweep string '%s'" % sweep)
+  parse_patch_string(m.group(1)) #check endpoints
+  axes=[]
+  for c in m.group(3).split(','):
+    m_=sweep_change_regex.match(c)
+    if m_ is None:
+      sys.exit("Could not parse sweep string '%s'" % sweep)
+    axes+=[(m_.group(1), m_.group(2), parse_sweep_values(m_.group(3)))]
+  return m.group(1), axes
+
+def expand_sweeps(sweeps):
+  """Patch string lists of every variant, all registers of all sweeps form one grid"""
+  parsed=[parse_sweep_string(s) for s in sweeps]
+  axes=[axis for p, a in parsed for axis in a]
+  variants=[]
+  for values in itertools.product(*[a[2] for a in axes]):
+    values=iter(values)
+    patches=[]
+    for p, a in parsed:
+      patches+=['%s[%s]' % (p, ','.join('%s%s%d' % (name, eqop, values.next()) for name, eqop, v in a))]
+    variants+=[patches]
+  return variants
+
+#base bios of a worker, variants are written over it and reverted again so it is never copied
+sweep_bios=None
+sweep_timing_entries=None
+
+def init_sweep_worker(bios, timing_table_offset, timing_entry_length):
+  global sweep_bios, sweep_timing_entries
+  sweep_bios=bios
+  sweep_timing_entries=(timing_table_offset, timing_entry_length)
+
+def write_variant(job):
+  path, plan=job
+  timing_table_offset, timing_entry_length=sweep_timing_entries
+  saved=[]
+  try:
+    for id_, timing in plan:
+      offset=timing_table_offset+2+(timing_entry_length+4)*id_+4
+      saved+=[(offset, bytes(sweep_bios[offset:offset+timing_entry_length]))]
+      write_bios_range(sweep_bios, offset, timing)
+    with open(path, 'wb') as variant_file:
+      variant_file.write(sweep_bios)
+  finally:
+    for offset, timing in reversed(saved):
+      write_bios_range(sweep_bios, offset, timing)
+  return path
+
+def validate_plans(original_timing_table, plans, timing_entry_type, baselines=None):
+  #timing rule violations of all plans in one pass, {plan index: ['<entry id>:<rule>']}, changed entries compared with
+  #the table as loaded, copies with the baselines of their plan
+  strings=[(n, id_, timing) for n, plan in enumerate(plans) for id_, timing in plan]
+  originals=[(baselines[n] if baselines else {}).get(id_, original_timing_table.timing(id_)) for n, id_, timing in strings]
+  violations={}
+  for i, r in validate_timings(timing_entry_type, [s[2] for s in strings], originals):
+    violations.setdefault(strings[i][0], []).append('%d:%s' % (strings[i][1], r[0]))
+  return violations
+
+def run_sweep(image, variants, output_pattern, processes=None, force=False):
+  """Write every variant of image to output_pattern % n, yields (path, patches, error message or None)"""
+  timing_table, timing_entry_type=image.timing_table, image.timing_entry_type
+  jobs=[]
+  job_baselines=[]
+  variant_patches={}
+  for n, patches in enumerate(variants):
+    path=output_pattern % n
+    try:
+      baselines=dict(image.patch_baselines)
+      jobs+=[(path, compile_patches(timing_table, [parse_patch_string(p) for p in patches], timing_entry_type, baselines))]
+      job_baselines+=[baselines]
+      variant_patches[path]=patches
+    except SystemExit as e:
+      yield path, patches, str(e)
+
+  if not force:
+    violations=validate_plans(image.original_timing_table, [plan for path, plan in jobs], timing_entry_type, job_baselines)
+    for n in sorted(violations):
+      path=jobs[n][0]
+      yield path, variant_patches[path], 'Breaks timing rules %s' % ' '.join(violations[n])
+    jobs=[j for n, j in enumerate(jobs) if n not in violations]
+
+  args=(image.serialize(), image.timing_table_offset, image.timing_entry_length)
+  if processes==1:
+    init_sweep_worker(*args)
+    for path in itertools.imap(write_variant, jobs):
+      yield path, variant_patches[path], None
+    return
+
+  pool=multiprocessing.Pool(processes, init_sweep_worker, args)
+  try:
+    for path in pool.imap(write_variant, jobs, max(1, len(jobs)/(4*(processes or multiprocessing.cpu_count())))):
+      yield path, variant_patches[path], None
+    pool.close()
+  finally:
+    pool.terminate()
+    pool.join()
+
+if __name__ == '__main__':
+  parser = optparse.OptionParser(usage="%prog [options] -i <bios> -d <dir> -s <sweep>...")
+  parser.add_option("-i", "--input", dest="input", help="Base bios file")
+  parser.add_option("-d", "--outputdir", dest="output_dir", help="Directory for the variants")
+  parser.add_option("-s", "--sweep", dest="sweep", action="append", help="Patch with value lists A/B/C or ranges A..B[:STEP] for registers, e.g. 0:200000=0:200000[TRC-=0..6,TCL=7/8/9]")
+  parser.add_option("-p", "--patch", dest="patch", action="append", help="Patch applied to the base bios before the sweep")
+  parser.add_option("--manifest", dest="manifest", default=None, help="File listing '<variant> <patch>...' per line (default <outputdir>/variants.txt)")
+  parser.add_option("--force", dest="force", action="store_true", default=False, help="Write variants even if they break timing rules")
+  parser.add_option("-j", "--jobs", dest="jobs", default=None, help="Number of worker processes (default number of cpus)")
+  parser.add_option("--offset", dest="timing_table_offset", default=None, help="Timing table offset in bios relative to vram_info_table_offset+usMemClkPatchTblOffset+44 (default autodetect)")
+  parser.add_option("--length", dest="timing_table_length", default=None, help="Number of timings entries in bios to read (default autodetect)")
+  parser.add_option("--elength", dest="timing_entry_length", default=None, help="Lenght of timing string (default autodetect)")
+  parser.add_option("--type", dest="timing_entry_type", default=None, help="Type of timing entriy to decode (default autodetect)")
+
+  (options, args) = parser.parse_args()
+  if options.input is None or options.output_dir is None:
+    parser.error("Options 'input' and 'outputdir' are required")
+  if not options.sweep:
+    parser.error("At least one sweep is required")
+
+  variants=expand_sweeps(options.sweep)
+
+  image=BiosImage.load(options.input,
+    timing_entry_type=options.timing_entry_type,
+    timing_entry_length=int(options.timing_entry_length) if options.timing_entry_length is not None else None,
+    timing_table_offset=int(options.timing_table_offset) if options.timing_table_offset is not None else None,
+    timing_table_length=int(options.timing_table_length) if options.timing_table_length is not None else None)
+  if image.timing_entry_type not in ['R9', 'RX']:
+    sys.exit('Could not detect timing entry type')
+  if image.timing_table_length==0:
+    sys.exit('Could not find timing table')
+  if options.patch:
+    image.patch(options.patch)
+    violations=image.validate()
+    for v in violations:
+      print >>sys.stderr, format_violation(v)
+    if violations and not options.force:
+      sys.exit('%d timing rule violations in base patches, use --force to write anyway' % len(violations))
+
+  if not os.path.isdir(options.output_dir):
+    os.makedirs(options.output_dir)
+  base, ext=os.path.splitext(os.path.basename(options.input))
+  output_pattern=os.path.join(options.output_dir, '%s_%%0%dd%s' % (base.replace('%', '%%'), len(str(len(variants)-1)), ext.replace('%', '%%')))
+
+  failed=0
+  with open(options.manifest or os.path.join(options.output_dir, 'variants.txt'), 'w') as manifest_file:
+    for path, patches, message in run_sweep(image, variants, output_pattern, int(options.jobs) if options.jobs is not None else None, options.force):
+      if message is not None:
+        failed+=1
+        print >>sys.stderr, "%s: %s %s" % (path, ' '.join(patches), message)
+      else:
+        print >>manifest_file, path, ' '.join(patches)
+
+  print >>sys.stderr, "%d of %d variants written, %d failed" % (len(variants)-failed, len(variants), failed)
+  if failed:
+    sys.exit(1)
@@ -0,0 +1,67 @@
+import sys
+from atom_rom_timings import get_numpy, strap_matrix, decode_columns, register_cache, register_codecs, timing_register_names, get_subregister
+
+#relations between timings checked on patched straps, field widths are enforced by set_subregister already
+
+#(name, fields, check) where check gets {field: NumPy column or int} and is true where the strap is fine
+timing_rules=[
+  ('TRCDR<=TRC', ['TRCDR', 'TRC'], lambda f: f['TRCDR']<=f['TRC']),
+  ('TRCDW<=TRC', ['TRCDW', 'TRC'], lambda f: f['TRCDW']<=f['TRC']),
+  ('TRCDR+TRP<=TRC', ['TRCDR', 'TRP', 'TRC'], lambda f: f['TRCDR']+f['TRP']<=f['TRC']), #tRC=tRAS+tRP and the row stays open for at least tRCD
+  ('TRRD<=FAW', ['TRRD', 'FAW'], lambda f: (f['FAW']==0) | (f['TRRD']<=f['FAW'])), #zero FAW is not enforced
+]
+
+vectorize_min_timings=256 #below this the register cache is faster than importing NumPy
+
+def check_timings(bios_type, timings, rules=None):
+  """[(rule, [bool per timing string])], true where the rule holds, one vectorized pass for many strings if NumPy is installed"""
+  if rules is None:
+    rules=timing_rules
+  if not timings:
+    return [(r, []) for r in rules]
+  if len(timings)>=vectorize_min_timings and get_numpy() is not None:
+    fields=decode_columns(bios_type, strap_matrix(timings, len(timings[0])))
+    return [(r, r[2](fields).tolist()) for r in rules]
+
+  results=[(r, []) for r in rules]
+  for s in timings:
+    entry=register_cache.get(bios_type, s)[0]
+    fields={}
+    for r_name in reversed(timing_register_names): #first register wins
+      fields.update(entry[r_name])
+    for r, ok in results:
+      ok+=[bool(r[2](fields))]
+  return results
+
+def validate_timings(bios_type, timings, original_timings=None, rules=None):
+  """Violations as (index, rule), with original timings only the rules those did not break already are reported"""
+  if bios_type not in register_codecs:
+    sys.exit('Bios type is required to validate timing rules')
+  if original_timings is not None and len(original_timings)!=len(timings):
+    sys.exit('Wrong number of original timing strings')
+  n=len(timings)
+  results=check_timings(bios_type, list(timings)+list(original_timings or []), rules)
+  violations=[]
+  for i in xrange(n):
+    for r, ok in results:
+      if not ok[i] and (original_timings is None or ok[n+i]):
+        violations+=[(i, r)]
+  return violations
+
+def validate_timing_table(bios_type, timing_table, original_timing_table=None, rules=None, baselines=None):
+  """Violations of changed entries (all entries without original table) as dicts with id, freq, type, rule and values,
+  copied entries are compared with their source strap from baselines ({entry id: timing string}) instead of the one they replaced"""
+  if original_timing_table is None:
+    ids=range(len(timing_table))
+    original_timings=None
+  else:
+    ids=[i for i in xrange(len(timing_table)) if timing_table.timing(i)!=original_timing_table.timing(i)]
+    original_timings=[(baselines or {}).get(i, original_timing_table.timing(i)) for i in ids]
+  violations=[]
+  for i, (name, fields, check) in validate_timings(bios_type, [timing_table.timing(i) for i in ids], original_timings, rules):
+    c, t, s=timing_table[ids[i]]
+    violations+=[{'id': ids[i], 'freq': c, 'type': t, 'rule': name, 'values': dict((f, get_subregister(bios_type, f, s)) for f in fields)}]
+  return violations
+
+def format_violation(v):
+  return "Entry %d (%d:%d) breaks %s: %s" % (v['id'], v['type'], v['freq'], v['rule'], ','.join('%s=%d' % a for a in sorted(v['values'].items())))
@@ -0,0 +1,70 @@
+import optparse
+import sys
+import os
+import timeit
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from construct import *
+import atom_rom
+from atom_rom import atom_rom_header_ptr, construct_struct
+from atom_timings_editor import detect_timing_table_offset, detect_timing_table_length
+from synthetic_rom import make_bios
+
+#slice based readers as they were before parse_struct, kept for comparison
+
+ATOM_ROM_HEADER=construct_struct(atom_rom.ATOM_ROM_HEADER)
+ATOM_MASTER_DATA_TABLE=construct_struct(atom_rom.ATOM_MASTER_DATA_TABLE)
+ATOM_VRAM_INFO_TABLE=construct_struct(atom_rom.ATOM_VRAM_INFO_TABLE)
+ATOM_VRAM_TIMING_ENTRY=Struct("ATOM_VRAM_TIMING_ENTRY",
+  ULInt32("ulClkRange"), #24 bit clock and 8 bit type
+  Bytes("ucLatency", 0x30)
+)
+
+def legacy_detect_timing_table_offset(bios, offset):
+  atom_rom_header_offset=ULInt16("atom_rom_header_offset").parse(bios[atom_rom_header_ptr:atom_rom_header_ptr+2])
+  atom_rom_header=ATOM_ROM_HEADER.parse(bios[atom_rom_header_offset:])
+  atom_master_data_table=ATOM_MASTER_DATA_TABLE.parse(bios[atom_rom_header.usMasterDataTableOffset:])
+  atom_vram_info_table=ATOM_VRAM_INFO_TABLE.parse(bios[atom_master_data_table.VRAM_Info:])
+  return atom_master_data_table.VRAM_Info+atom_vram_info_table.usMemClkPatchTblOffset+0x2c+offset
+
+def legacy_detect_timing_table_length(bios, atom_vram_timing_table_offset, timing_entry_length=0x30):
+  for i in xrange(12*3):
+    t=ATOM_VRAM_TIMING_ENTRY.parse(bios[atom_vram_timing_table_offset+2+(timing_entry_length+4)*i:])
+    if t.ulClkRange==0:
+      return i
+  return 0
+
+def bench(f, number):
+  return min(timeit.repeat(f, repeat=3, number=number))/number
+
+if __name__ == '__main__':
+  parser = optparse.OptionParser(usage="%prog [options] [<bios>]")
+  parser.add_option("--size", dest="size", default=None, help="Pad bios image to given size in KB (default bios size)")
+  parser.add_option("-n", "--number", dest="number", default=100, help="Number of runs per measurement (default 100)")
+
+  (options, args) = parser.parse_args()
+  if len(args)>1:
+    parser.error("Only one bios file is allowed")
+
+  if args:
+    with open(args[0], 'rb') as bios_file:
+      bios=bytearray(bios_file.read())
+  else:
+    bios=make_bios()
+  if options.size is not None and int(options.size)*1024>len(bios):
+    bios+=bytearray(int(options.size)*1024-len(bios))
+  number=int(options.number)
+
+  offset=detect_timing_table_offset(bios, 0)
+  if offset!=legacy_detect_timing_table_offset(bios, 0):
+    sys.exit('Timing table offset mismatch')
+  if detect_timing_table_length(bios, offset)!=legacy_detect_timing_table_length(bios, offset):
+    sys.exit('Timing table length mismatch')
+
+  print "bios size %d bytes" % len(bios)
+  for name, legacy, new in [
+    ('detect_timing_table_offset', lambda: legacy_detect_timing_table_offset(bios, 0), lambda: detect_timing_table_offset(bios, 0)),
+    ('detect_timing_table_length', lambda: legacy_detect_timing_table_length(bios, offset), lambda: detect_timing_table_length(bios, offset)),
+  ]:
+    t_legacy=bench(legacy, number)
+    t_new=bench(new, number)
+    print "%-28s slices %9.1f us, in place %7.1f us, %6.1fx" % (name, t_legacy*1e6, t_new*1e6, t_legacy/t_new)
@@ -0,0 +1,91 @@
+import optparse
+import sys
+import os
+import json
+import time
+import platform
+import tempfile
+import shutil
+import subprocess
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from synthetic_rom import make_bios
+
+#cold start of short cli invocations, every run is a new interpreter
+
+package_dir=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+editor_path=os.path.join(package_dir, 'atom_timings_editor.py')
+
+#modules that are slow to import and only needed by some code paths
+heavy_modules=['construct', 'numpy', 'sqlite3', 'multiprocessing', 'cProfile']
+
+startup_modules=['atom_rom', 'atom_rom_timings', 'atom_signatures', 'atom_timings_validate', 'atom_timings_editor']
+
+def startup_commands(bios_path, output_path):
+  return [
+    ('python', [sys.executable, '-c', 'pass']), #interpreter alone for reference
+    ('version', [sys.executable, editor_path, '-i', bios_path]),
+    ('dump_table', [sys.executable, editor_path, '-i', bios_path, '-O', os.devnull]),
+    ('dump_registers', [sys.executable, editor_path, '-i', bios_path, '-O', os.devnull, '-r']),
+    ('modules', [sys.executable, editor_path, '-i', bios_path, '--modules']),
+    ('patch', [sys.executable, editor_path, '-i', bios_path, '-o', output_path, '-p', '0:200000=0:175000[TRC=50]']),
+  ]
+
+def run_command(cmd, runs):
+  times=[]
+  with open(os.devnull, 'w') as null:
+    for i in xrange(runs):
+      t=time.time()
+      subprocess.check_call(cmd, stdout=null, cwd=package_dir)
+      times+=[time.time()-t]
+  times.sort()
+  return {'seconds': times[0], 'median_seconds': times[len(times)/2], 'runs': runs}
+
+def import_time(module, runs):
+  #import of one module in a fresh interpreter and the heavy modules it pulled in
+  code="import sys, time, json; t=time.time(); import %s; print json.dumps([time.time()-t, [m for m in %r if m in sys.modules]])" % (module, heavy_modules)
+  times=[]
+  for i in xrange(runs):
+    t, loaded=json.loads(subprocess.check_output([sys.executable, '-c', code], cwd=package_dir))
+    times+=[t]
+  return {'seconds': min(times), 'heavy_modules': loaded}
+
+if __name__ == '__main__':
+  parser = optparse.OptionParser()
+  parser.add_option("--type", dest="timing_entry_type", default="R9", help="Bios type of the synthetic bios (default R9)")
+  parser.add_option("-n", "--runs", dest="runs", default=10, help="Number of runs per command (default 10)")
+  parser.add_option("-o", "--output", dest="output", default="-", help="JSON results file/stdout (default stdout)")
+
+  (options, args) = parser.parse_args()
+  if len(args)>1:
+    parser.error("Only one bios file is allowed")
+
+  runs=int(options.runs)
+  report={
+    'python': platform.python_version(),
+    'platform': platform.platform(),
+    'time': time.time(),
+    'params': {'runs': runs, 'bios': args[0] if args else options.timing_entry_type},
+    'results': {'commands': {}, 'imports': {}},
+  }
+
+  tmp_dir=tempfile.mkdtemp()
+  try:
+    if args:
+      bios_path=os.path.abspath(args[0])
+    else:
+      bios_path=os.path.join(tmp_dir, 'bios.rom')
+      with open(bios_path, 'wb') as bios_file:
+        bios_file.write(make_bios(options.timing_entry_type))
+    for name, cmd in startup_commands(bios_path, os.path.join(tmp_dir, 'patched.rom')):
+      report['results']['commands'][name]=run_command(cmd, runs)
+    for module in startup_modules:
+      report['results']['imports'][module]=import_time(module, runs)
+  finally:
+    shutil.rmtree(tmp_dir)
+
+  if options.output=='-':
+    json.dump(report, sys.stdout, indent=2, sort_keys=True)
+    print
+  else:
+    with open(options.output, 'w') as f:
+      json.dump(report, f, indent=2, sort_keys=True)
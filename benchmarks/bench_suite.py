@@ -0,0 +1,125 @@
+import optparse
+import sys
+import os
+import json
+import time
+import timeit
+import platform
+import tempfile
+import shutil
+import subprocess
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from atom_rom import fix_bios_checksum
+from atom_rom_timings import format_register_string, set_register_in_string, register_cache
+from atom_timings_editor import detect_timing_table_offset, detect_timing_table_length, parse_timing_table, parse_patch_string, apply_patches
+from synthetic_rom import make_bios
+
+editor_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'atom_timings_editor.py')
+
+benchmark_patches=['0:200000=0:175000[TRC=40,TRFC=120]', '0:225000-=0:200000[TCL=7]', '1=0[FAW=4]']
+
+def bench(f, number, repeat=3):
+  return min(timeit.repeat(f, repeat=repeat, number=number))/number
+
+def copy_timing_table(timing_table):
+  return timing_table.snapshot()
+
+def table_bytes(timing_table):
+  #memory held by a TimingTable next to the bios image
+  return sum(sys.getsizeof(a) for a in [timing_table, timing_table.clocks, timing_table.types, timing_table.timings])
+
+def run_stages(bios, bios_type, timing_entry_length, number):
+  offset=detect_timing_table_offset(bios, 0)
+  length=detect_timing_table_length(bios, offset, timing_entry_length)
+  timing_table=parse_timing_table(bios, offset, length, timing_entry_length)
+  patches=[parse_patch_string(p) for p in benchmark_patches]
+
+  def decode():
+    register_cache.clear() #every iteration decodes, not only the first
+    for c, t, s in timing_table:
+      format_register_string(bios_type, s)
+
+  def encode():
+    for s in work_timings:
+      set_register_in_string(bios_type, 'TRC', 50, '=', s)
+      set_register_in_string(bios_type, 'TRFC', 150, '=', s)
+
+  work_timings=[bytearray(s) for c, t, s in timing_table]
+  stages=[
+    ('detect_timing_table_offset', lambda: detect_timing_table_offset(bios, 0), 1),
+    ('detect_timing_table_length', lambda: detect_timing_table_length(bios, offset, timing_entry_length), 1),
+    ('parse_timing_table', lambda: parse_timing_table(bios, offset, length, timing_entry_length), length),
+    ('register_decode', decode, length),
+    ('register_decode_cached', lambda: [format_register_string(bios_type, s) for c, t, s in timing_table], length),
+    ('register_encode', encode, 2*length),
+    ('apply_patches', lambda: apply_patches(copy_timing_table(timing_table), patches, bios_type), len(patches)),
+    ('fix_bios_checksum', lambda: fix_bios_checksum(bios), 1),
+  ]
+  results={}
+  results['table_bytes_per_strap']=table_bytes(timing_table)/float(length)
+  for name, f, items in stages:
+    t=bench(f, number)
+    results[name]={'seconds': t, 'items': items, 'seconds_per_item': t/items}
+  return results
+
+def run_cli(bios_path, output_path, runs):
+  cmd=[sys.executable, editor_path, '-i', bios_path, '-o', output_path, '-O', os.devnull, '-r', '--force'] #synthetic straps break timing rules
+  for p in benchmark_patches:
+    cmd+=['-p', p]
+  times=[]
+  for i in xrange(runs):
+    t=time.time()
+    subprocess.check_call(cmd)
+    times+=[time.time()-t]
+  return {'seconds': min(times), 'items': 1, 'seconds_per_item': min(times)}
+
+if __name__ == '__main__':
+  parser = optparse.OptionParser()
+  parser.add_option("--type", dest="timing_entry_type", action="append", help="Bios types to benchmark (default R9 and RX)")
+  parser.add_option("--straps", dest="straps", default=12, help="Timing entries per vram module (default 12)")
+  parser.add_option("--elength", dest="timing_entry_length", default=0x30, help="Lenght of timing string (default 48)")
+  parser.add_option("--modules", dest="modules", default=1, help="Number of vram modules (default 1)")
+  parser.add_option("--size", dest="image_size", default=None, help="Size of the image file in KB (default rom size 64)")
+  parser.add_option("-n", "--number", dest="number", default=100, help="Number of runs per measurement (default 100)")
+  parser.add_option("--cli-runs", dest="cli_runs", default=5, help="Number of full CLI round trips, 0 to skip (default 5)")
+  parser.add_option("-o", "--output", dest="output", default="-", help="JSON results file/stdout (default stdout)")
+
+  (options, args) = parser.parse_args()
+
+  timing_entry_length=int(options.timing_entry_length)
+  report={
+    'python': platform.python_version(),
+    'platform': platform.platform(),
+    'time': time.time(),
+    'params': {
+      'straps': int(options.straps),
+      'timing_entry_length': timing_entry_length,
+      'modules': int(options.modules),
+      'image_size': int(options.image_size) if options.image_size is not None else None,
+      'number': int(options.number),
+      'patches': benchmark_patches,
+    },
+    'results': {},
+  }
+
+  tmp_dir=tempfile.mkdtemp()
+  try:
+    for bios_type in options.timing_entry_type or ['R9', 'RX']:
+      bios=make_bios(bios_type, int(options.straps), timing_entry_length, int(options.modules),
+        image_size=int(options.image_size) if options.image_size is not None else None)
+      results=run_stages(bios, bios_type, timing_entry_length, int(options.number))
+      if int(options.cli_runs)>0:
+        bios_path=os.path.join(tmp_dir, '%s.rom' % bios_type)
+        with open(bios_path, 'wb') as bios_file:
+          bios_file.write(bios)
+        results['cli_roundtrip']=run_cli(bios_path, os.path.join(tmp_dir, '%s.patched.rom' % bios_type), int(options.cli_runs))
+      report['results'][bios_type]=results
+  finally:
+    shutil.rmtree(tmp_dir)
+
+  if options.output=='-':
+    json.dump(report, sys.stdout, indent=2, sort_keys=True)
+    print
+  else:
+    with open(options.output, 'w') as f:
+      json.dump(report, f, indent=2, sort_keys=True)
@@ -0,0 +1,126 @@
+import optparse
+import sys
+import os
+import random
+import struct
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from atom_rom import ATOM_ROM_HEADER, ATOM_MASTER_DATA_TABLE, ATOM_VRAM_INFO_TABLE, ATOM_VRAM_ENTRY, atom_rom_header_ptr, get_compiled_struct, fix_bios_checksum
+
+#synthetic but structurally valid atom bioses for benchmarks, everything the editor reads is filled in
+
+bios_versions={
+  'R9': '015.049.000.001.000000',
+  'RX': '015.050.002.001.000000',
+}
+
+memory_vendor_ids=[1, 2, 3, 6] #samsung, infineon/qimonda, elpida, hynix (low nibble of ucMemoryVenderID)
+
+pcir_offset=0x60 #clear of the checksum byte at 0x21
+version_offset=0x80
+atom_rom_header_offset=0x100
+atom_master_data_table_offset=0x200
+atom_vram_info_table_offset=0x400
+mem_clk_patch_table_offset=0x200 #relative to vram info table
+vram_module_size=0x40
+
+def pack_struct(cnst, values):
+  #missing fields are zero, nested structs take dicts
+  packer, layout=get_compiled_struct(cnst)
+  flat=[]
+  def walk(layout, values):
+    for name, sub_layout in layout:
+      if sub_layout is None:
+        flat.append(values.get(name, 0))
+      else:
+        walk(sub_layout, values.get(name, {}))
+  walk(layout, values)
+  return packer.pack(*flat)
+
+def make_bios(bios_type='R9', straps=12, timing_entry_length=0x30, modules=1, rom_size=64, image_size=None, device_id=0x67df, seed=0):
+  """Bios with one timing table of straps entries per vram module, sizes in KB"""
+  rnd=random.Random(seed)
+  if image_size is None:
+    image_size=rom_size
+  if rom_size*2>255:
+    sys.exit('Rom size %d KB does not fit into the size byte' % rom_size)
+  bios=bytearray(image_size*1024)
+  bios[rom_size*1024:]='\xff'*((image_size-rom_size)*1024)
+
+  #legacy option rom header and pci data structure
+  bios[0:3]=struct.pack('<BBB', 0x55, 0xaa, rom_size*2)
+  struct.pack_into('<H', bios, 0x18, pcir_offset)
+  struct.pack_into('<4sHHHHBBBBHHBBH', bios, pcir_offset, 'PCIR', 0x1002, device_id, 0, 0x18, 0, 0, 0, 3, rom_size*2, 1, 0, 0x80, 0)
+
+  version='ATI VER'+bios_versions[bios_type]
+  bios[version_offset:version_offset+len(version)]=version
+
+  struct.pack_into('<H', bios, atom_rom_header_ptr, atom_rom_header_offset)
+  atom_rom_header=pack_struct(ATOM_ROM_HEADER, {
+    'sHeader': {'usStructureSize': get_compiled_struct(ATOM_ROM_HEADER)[0].size, 'ucTableFormatRevision': 1, 'ucTableContentRevision': 1},
+    'uaFirmWareSignature': struct.unpack('<I', 'ATOM')[0],
+    'usMasterDataTableOffset': atom_master_data_table_offset,
+    'usVendorID': 0x1002,
+    'usDeviceID': device_id,
+  })
+  bios[atom_rom_header_offset:atom_rom_header_offset+len(atom_rom_header)]=atom_rom_header
+
+  atom_master_data_table=pack_struct(ATOM_MASTER_DATA_TABLE, {
+    'sHeader': {'usStructureSize': get_compiled_struct(ATOM_MASTER_DATA_TABLE)[0].size, 'ucTableFormatRevision': 1, 'ucTableContentRevision': 1},
+    'VRAM_Info': atom_vram_info_table_offset,
+  })
+  bios[atom_master_data_table_offset:atom_master_data_table_offset+len(atom_master_data_table)]=atom_master_data_table
+
+  timing_table_offset=atom_vram_info_table_offset+mem_clk_patch_table_offset+0x2c
+  timing_table_size=2+modules*straps*(timing_entry_length+4)+4
+  atom_vram_info_table=pack_struct(ATOM_VRAM_INFO_TABLE, {
+    'sHeader': {'usStructureSize': timing_table_offset+timing_table_size-atom_vram_info_table_offset, 'ucTableFormatRevision': 2, 'ucTableContentRevision': 1},
+    'usMemClkPatchTblOffset': mem_clk_patch_table_offset,
+    'ucNumOfVRAMModule': modules,
+    'ucMemoryClkPatchTblVer': 1,
+    'ucVramModuleVer': 7,
+  })
+  bios[atom_vram_info_table_offset:atom_vram_info_table_offset+len(atom_vram_info_table)]=atom_vram_info_table
+  if atom_vram_info_table_offset+len(atom_vram_info_table)+modules*vram_module_size>timing_table_offset-0x2c:
+    sys.exit('Too many vram modules')
+
+  for m in xrange(modules):
+    vram_entry=pack_struct(ATOM_VRAM_ENTRY, {
+      'usModuleSize': vram_module_size,
+      'ucMemoryType': 0x50, #gddr5
+      'ucMemoryVenderID': memory_vendor_ids[m % len(memory_vendor_ids)],
+    })
+    o=atom_vram_info_table_offset+len(atom_vram_info_table)+m*vram_module_size
+    bios[o:o+len(vram_entry)]=vram_entry
+
+  if timing_table_offset+timing_table_size>rom_size*1024:
+    sys.exit('Timing table does not fit into the rom')
+  struct.pack_into('<BB', bios, timing_table_offset, 1, straps)
+  o=timing_table_offset+2
+  for m in xrange(modules):
+    for i in xrange(straps):
+      struct.pack_into('<I', bios, o, 100000+25000*i+m*0x1000000)
+      bios[o+4:o+4+timing_entry_length]=bytearray(rnd.getrandbits(8) for j in xrange(timing_entry_length))
+      o+=timing_entry_length+4
+  struct.pack_into('<I', bios, o, 0)
+
+  fix_bios_checksum(bios)
+  return bios
+
+if __name__ == '__main__':
+  parser = optparse.OptionParser(usage="%prog [options] <output>")
+  parser.add_option("--type", dest="timing_entry_type", default="R9", help="Bios type R9 or RX (default R9)")
+  parser.add_option("--straps", dest="straps", default=12, help="Timing entries per vram module (default 12)")
+  parser.add_option("--elength", dest="timing_entry_length", default=0x30, help="Lenght of timing string (default 48)")
+  parser.add_option("--modules", dest="modules", default=1, help="Number of vram modules (default 1)")
+  parser.add_option("--romsize", dest="rom_size", default=64, help="Size of the checksummed rom in KB (default 64)")
+  parser.add_option("--size", dest="image_size", default=None, help="Size of the image file in KB, padded with 0xff (default rom size)")
+  parser.add_option("--seed", dest="seed", default=0, help="Random seed for timing strings (default 0)")
+
+  (options, args) = parser.parse_args()
+  if len(args)!=1:
+    parser.error("Output file is required")
+
+  bios=make_bios(options.timing_entry_type, int(options.straps), int(options.timing_entry_length), int(options.modules),
+    int(options.rom_size), int(options.image_size) if options.image_size is not None else None, seed=int(options.seed))
+  with open(args[0], 'wb') as bios_file:
+    bios_file.write(bios)
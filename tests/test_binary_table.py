@@ -0,0 +1,60 @@
+import sys
+import os
+import random
+import unittest
+import StringIO
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from atom_rom_timings import get_numpy
+from atom_timing_table import TimingTable
+from atom_timings_editor import save_binary_timing_table, load_binary_timing_table, is_binary_timing_table, binary_timing_table_array, save_text_timing_table, load_text_timing_table
+
+def make_table(timing_entry_length=0x30):
+  rnd=random.Random(0)
+  return TimingTable.from_entries([(c, t, bytes(bytearray(rnd.randrange(256) for i in xrange(timing_entry_length)))) for t in [0, 1] for c in [100000, 125000, 150000]])
+
+def save(timing_table, bios_type):
+  f=StringIO.StringIO()
+  save_binary_timing_table(f, timing_table, bios_type)
+  return f.getvalue()
+
+class BinaryTimingTableTest(unittest.TestCase):
+
+  def test_round_trip(self):
+    for bios_type, timing_entry_length in [('R9', 0x30), ('RX', 0x30), (None, 0x40)]:
+      table=make_table(timing_entry_length)
+      f=StringIO.StringIO(save(table, bios_type))
+      self.assertTrue(is_binary_timing_table(f))
+      loaded, loaded_bios_type=load_binary_timing_table(f)
+      self.assertEqual(loaded_bios_type, bios_type)
+      self.assertEqual(loaded.timing_entry_length, timing_entry_length)
+      self.assertEqual(list(map(tuple, loaded)), list(map(tuple, table)))
+
+  def test_same_table_as_text(self):
+    table=make_table()
+    text=StringIO.StringIO()
+    save_text_timing_table(text, table)
+    text.seek(0)
+    loaded, bios_type=load_binary_timing_table(StringIO.StringIO(save(table, 'R9')))
+    self.assertEqual(loaded.pack(), load_text_timing_table(text).pack())
+
+  def test_text_is_not_binary(self):
+    f=StringIO.StringIO('100000 0 00\n')
+    self.assertFalse(is_binary_timing_table(f))
+    self.assertEqual(f.read(), '100000 0 00\n')
+
+  def test_truncated(self):
+    data=save(make_table(), 'R9')
+    for n in [0, 8, len(data)-1]:
+      self.assertRaises(SystemExit, load_binary_timing_table, StringIO.StringIO(data[0:n]))
+
+  @unittest.skipIf(get_numpy() is None, 'NumPy is not installed')
+  def test_array(self):
+    table=make_table()
+    array=binary_timing_table_array(save(table, 'R9'))
+    self.assertEqual(len(array), len(table))
+    for (c, t, s), row in zip(table, array):
+      self.assertEqual(int(row['clk']), c+t*0x1000000)
+      self.assertEqual(bytes(bytearray(row['timing'])), s)
+
+if __name__ == '__main__':
+  unittest.main()
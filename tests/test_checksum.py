@@ -0,0 +1,56 @@
+import sys
+import os
+import mmap
+import random
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+from atom_rom import bios_bytes_sum, write_bios_range, fix_bios_checksum, verify_bios_checksum, get_bios_size, atom_rom_checksum_offset
+from atom_timings_editor import BiosImage
+from synthetic_rom import make_bios
+
+#the incremental checksum of write_bios_range must end where a full recompute does
+
+class ChecksumTest(unittest.TestCase):
+
+  def setUp(self):
+    self.rnd=random.Random(0)
+    self.bios=make_bios('R9', rom_size=32, image_size=64) #bytes after the rom size are not summed
+
+  def random_bytes(self, n):
+    return bytearray(self.rnd.randrange(256) for i in xrange(n))
+
+  def test_bytes_sum(self):
+    data=self.random_bytes(5000)
+    for start, end in [(0, None), (0, 256), (1, 257), (300, 4999), (4000, 4000)]:
+      self.assertEqual(bios_bytes_sum(data, start, end), sum(data[start:end]))
+
+  def test_bytes_sum_mmap(self):
+    data=self.random_bytes(3000)
+    m=mmap.mmap(-1, len(data))
+    m[:]=bytes(data)
+    self.assertEqual(bios_bytes_sum(m, 10, 2900), sum(data[10:2900]))
+
+  def test_synthetic_bios_checksum(self):
+    self.assertTrue(verify_bios_checksum(self.bios))
+
+  def test_write_range_matches_full_recompute(self):
+    size=get_bios_size(self.bios)
+    for offset, length in [(0x1000, 52), (size-20, 40), (size+100, 64), (atom_rom_checksum_offset-4, 8), (0, 2)]:
+      data=self.random_bytes(length)
+      bios=bytearray(self.bios)
+      write_bios_range(bios, offset, data)
+      full=bytearray(bios)
+      fix_bios_checksum(full)
+      self.assertEqual(bios, full, 'range 0x%x+%d' % (offset, length))
+      self.assertTrue(verify_bios_checksum(bios))
+
+  def test_serialized_patch_keeps_checksum(self):
+    image=BiosImage(self.bios)
+    image.patch('0:100000-=0:150000[TRC=60]')
+    bios=image.serialize()
+    self.assertNotEqual(bios, self.bios)
+    self.assertTrue(verify_bios_checksum(bios))
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,83 @@
+import sys
+import os
+import random
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from atom_rom_timings import get_subregister
+from atom_timing_table import TimingTable
+from atom_timings_editor import parse_patch_string, compile_patches, apply_patches
+
+#two vram modules with four straps each, module 1 has no 175000 strap
+
+def make_table():
+  rnd=random.Random(0)
+  entries=[(c, t, bytes(bytearray(rnd.randrange(256) for i in xrange(0x30)))) for t in [0, 1] for c in [100000, 125000, 150000, 175000] if (c, t)!=(175000, 1)]
+  return TimingTable.from_entries(entries)
+
+def compile_(timing_table, patches, baselines=None):
+  return dict(compile_patches(timing_table, [parse_patch_string(p) for p in patches], 'R9', baselines))
+
+class CompilePatchesTest(unittest.TestCase):
+
+  def setUp(self):
+    self.table=make_table()
+    self.ids=dict(((c, t), id_) for id_, (c, t, s) in enumerate(self.table))
+
+  def timing(self, c, t):
+    return self.table.timing(self.ids[(c, t)])
+
+  def test_copy(self):
+    plan=compile_(self.table, ['0:150000=0:100000'])
+    self.assertEqual(plan, {self.ids[(150000, 0)]: bytearray(self.timing(100000, 0))})
+
+  def test_range_stays_in_module(self):
+    plan=compile_(self.table, ['0:125000-=0:100000'])
+    self.assertEqual(sorted(plan), [self.ids[(c, 0)] for c in [125000, 150000, 175000]])
+
+  def test_changes(self):
+    plan=compile_(self.table, ['0:100000=0:100000[TRC=40]', '0:100000=0:100000[TRC+=2,TCL=7]'])
+    s=plan[self.ids[(100000, 0)]]
+    self.assertEqual((get_subregister('R9', 'TRC', s), get_subregister('R9', 'TCL', s)), (42, 7))
+
+  def test_chained_patches_copy_patched_source(self):
+    plan=compile_(self.table, ['0:125000=0:100000[TRC=50]', '0:150000=0:125000'])
+    self.assertEqual(plan[self.ids[(150000, 0)]], plan[self.ids[(125000, 0)]])
+    self.assertEqual(get_subregister('R9', 'TRC', plan[self.ids[(150000, 0)]]), 50)
+
+  def test_plan_leaves_table(self):
+    before=self.table.pack()
+    compile_(self.table, ['0:125000-=0:100000[TRC=50]'])
+    self.assertEqual(self.table.pack(), before)
+
+  def test_baselines_follow_chains(self):
+    baselines={}
+    compile_(self.table, ['0:125000=0:100000[TRC=50]', '0:150000=0:125000', '0:175000=0:175000[TCL=7]'], baselines)
+    self.assertEqual(baselines, {
+      self.ids[(125000, 0)]: self.timing(100000, 0),
+      self.ids[(150000, 0)]: self.timing(100000, 0), #through 125000 back to the strap as loaded
+      self.ids[(175000, 0)]: self.timing(175000, 0),
+    })
+
+  def test_baselines_across_calls(self):
+    baselines={}
+    apply_patches(self.table, [parse_patch_string('0:125000=0:100000')], 'R9', baselines)
+    original=self.timing(100000, 0)
+    compile_(self.table, ['0:150000=0:125000'], baselines)
+    self.assertEqual(baselines[self.ids[(150000, 0)]], original)
+
+  def test_module_expansion(self):
+    plan=compile_(self.table, ['*:125000=*:100000[TCL=7]'])
+    self.assertEqual(sorted(plan), [self.ids[(125000, 0)], self.ids[(125000, 1)]])
+    for t in [0, 1]:
+      expected=bytearray(self.timing(100000, t))
+      s=plan[self.ids[(125000, t)]]
+      self.assertEqual(get_subregister('R9', 'TCL', s), 7)
+      self.assertEqual(get_subregister('R9', 'TRC', s), get_subregister('R9', 'TRC', expected))
+
+  def test_module_expansion_skips_modules_without_endpoints(self):
+    plan=compile_(self.table, ['*:175000=*:100000'])
+    self.assertEqual(plan, {self.ids[(175000, 0)]: bytearray(self.timing(100000, 0))})
+    self.assertRaises(SystemExit, compile_, self.table, ['*:200000=*:100000'])
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,68 @@
+import sys
+import os
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from atom_rom_timings import format_register_string, set_register_in_string, decode_fields, decode_columns, strap_matrix, register_codecs, get_numpy, hexify
+
+#known straps with their register dumps, the shift/mask tables of register_codecs must keep decoding them bit exact
+
+#(bios type, timing string, register dump) decoded with the construct BitStructs the registers were defined with
+strap_vectors=[
+  ('R9', '1be682359bd1050425b829b4ad8b38f9cc8439a6659352a10f4cf7e04edb4ff0be6a4002e009d1f6912bdef9b4826058',
+    '[TRCDW=005,TRCDWA=001,TRCDR=014,TRCDRA=019,TRRD=002,TRC=052,unused1=001],[TNOPW=001,TNOPR=003,TR2W=026,TCCDL=005,TR2R=008,TW2R=024,unused1=001,TCL=025,unused2=007],[TRP_WRA=012,unused1=003,TRP_RDA=004,unused2=000,TRP=019,TRFC=099,unused3=005],[PA2RDATA=005,unused1=000,PA2WDATA=006,unused2=000,FAW=019,TREDC=004,TWEDC=018,T32AW=010,unused3=000,TWDATATR=010],[TCKSRE=007,unused1=001,TCKSRX=000,unused2=000,TCKE_PULSE=012,TCKE=052,SEQ_IDLE=005,unused3=003,TCKE_PULSE_MSB=001,SEQ_IDLE_SS=224],[ACTRD=145,ACTWR=043,RASMACTRD=222,RASMACTWR=249],[RAS2RAS=180,RP=130,WRPLUSRP=096,BUS_TURN=088]'),
+  ('R9', '406462b5a42e17b9c697b6c6f9691095eeb7806a663169cd1b978783d6cb73b51b29614bffa2d4e8b6c73e19e3ecc28c',
+    '[TRCDW=006,TRCDWA=030,TRCDR=005,TRCDRA=013,TRRD=011,TRC=070,unused1=001],[TNOPW=001,TNOPR=002,TR2W=031,TCCDL=004,TR2R=006,TW2R=016,unused1=000,TCL=021,unused2=004],[TRP_WRA=046,unused1=003,TRP_RDA=055,unused2=000,TRP=001,TRFC=168,unused3=003],[PA2RDATA=006,unused1=000,PA2WDATA=006,unused2=000,FAW=017,TREDC=001,TWEDC=009,T32AW=011,unused3=006,TWDATATR=012],[TCKSRE=003,unused1=001,TCKSRX=001,unused2=000,TCKE_PULSE=007,TCKE=057,SEQ_IDLE=001,unused3=000,TCKE_PULSE_MSB=001,SEQ_IDLE_SS=131],[ACTRD=182,ACTWR=199,RASMACTRD=062,RASMACTWR=025],[RAS2RAS=227,RP=236,WRPLUSRP=194,BUS_TURN=140]'),
+  ('RX', '26ebdada0d17d0785efc0a88712065b5e1068617cc150862bb5021cbcedb4d6c3e8e5456c8f4951aa772fcb8d5b389e5',
+    '[TRCDW=017,TRCDWA=003,TRCDR=008,TRCDRA=010,TRRD=006,TRC=053,unused1=001],[TNOPW=001,TNOPR=000,TR2W=014,TCCDL=003,TR2R=000,TW2R=006,unused1=004,TCL=023,unused2=000],[TRP_WRA=076,TRP_RDA=043,unused1=000,TRP=000,unused2=001,TRFC=032,unused3=003],[PA2RDATA=003,unused1=001,PA2WDATA=003,unused2=001,FAW=016,TREDC=002,TWEDC=001,T32AW=009,unused3=005,TWDATATR=012],[TCKSRE=006,unused1=001,TCKSRX=005,unused2=000,TCKE_PULSE=012,TCKE=047,SEQ_IDLE=002,unused3=000,TCKE_PULSE_MSB=000,SEQ_IDLE_SS=136],[ACTRD=167,ACTWR=114,RASMACTRD=252,RASMACTWR=184],[RAS2RAS=213,RP=179,WRPLUSRP=137,BUS_TURN=229]'),
+  ('RX', 'a4db5896c1144438af4475eecfbbc4e032f1dabc211a2016b52313b93c14db886e50fa30bd0d806a7c754eceb86f3b4f',
+    '[TRCDW=015,TRCDWA=030,TRCDR=014,TRCDRA=009,TRRD=012,TRC=096,unused1=001],[TNOPW=002,TNOPR=000,TR2W=019,TCCDL=000,TR2R=015,TW2R=026,unused1=006,TCL=028,unused2=005],[TRP_WRA=033,TRP_RDA=052,unused1=000,TRP=000,unused2=000,TRFC=354,unused3=000],[PA2RDATA=005,unused1=000,PA2WDATA=003,unused2=001,FAW=003,TREDC=001,TWEDC=019,T32AW=008,unused3=004,TWDATATR=011],[TCKSRE=007,unused1=001,TCKSRX=002,unused2=001,TCKE_PULSE=004,TCKE=020,SEQ_IDLE=005,unused3=003,TCKE_PULSE_MSB=000,SEQ_IDLE_SS=238],[ACTRD=124,ACTWR=117,RASMACTRD=078,RASMACTWR=206],[RAS2RAS=184,RP=111,WRPLUSRP=059,BUS_TURN=079]'),
+]
+
+#(bios type, subregister, operation, value, timing string after the change) on the first strap of each type
+set_vectors=[
+  ('R9', 'TRC', '=', 50, '1be682359bd1050425b829b2ad8b38f9cc8439a6659352a10f4cf7e04edb4ff0be6a4002e009d1f6912bdef9b4826058'),
+  ('R9', 'TCL', '+=', 3, '1be682359bd1050425b829b4ad8b38fccc8439a6659352a10f4cf7e04edb4ff0be6a4002e009d1f6912bdef9b4826058'),
+  ('R9', 'TRFC', '-=', 7, '1be682359bd1050425b829b4ad8b38f9cc84c9a5659352a10f4cf7e04edb4ff0be6a4002e009d1f6912bdef9b4826058'),
+  ('R9', 'TRP', '=', 31, '1be682359bd1050425b829b4ad8b38f9cc843fa6659352a10f4cf7e04edb4ff0be6a4002e009d1f6912bdef9b4826058'),
+  ('R9', 'TRRD', '=', 15, '1be682359bd1050425b8f9b4ad8b38f9cc8439a6659352a10f4cf7e04edb4ff0be6a4002e009d1f6912bdef9b4826058'),
+  ('R9', 'ACTRD', '=', 0, '1be682359bd1050425b829b4ad8b38f9cc8439a6659352a10f4cf7e04edb4ff0be6a4002e009d1f6002bdef9b4826058'),
+  ('RX', 'TRC', '=', 50, '26ebdada0d17d0785efc0a88712065b2e1068617cc150862bb5021cbcedb4d6c3e8e5456c8f4951aa772fcb8d5b389e5'),
+  ('RX', 'TCL', '+=', 3, '26ebdada0d17d0785efc0a88712065b5e106861acc150862bb5021cbcedb4d6c3e8e5456c8f4951aa772fcb8d5b389e5'),
+  ('RX', 'TRFC', '-=', 7, '26ebdada0d17d0785efc0a88712065b5e1068617cc159861bb5021cbcedb4d6c3e8e5456c8f4951aa772fcb8d5b389e5'),
+  ('RX', 'TRP', '=', 31, '26ebdada0d17d0785efc0a88712065b5e1068617ccd50f62bb5021cbcedb4d6c3e8e5456c8f4951aa772fcb8d5b389e5'),
+  ('RX', 'TRRD', '=', 15, '26ebdada0d17d0785efc0a887120f5b5e1068617cc150862bb5021cbcedb4d6c3e8e5456c8f4951aa772fcb8d5b389e5'),
+  ('RX', 'ACTRD', '=', 0, '26ebdada0d17d0785efc0a88712065b5e1068617cc150862bb5021cbcedb4d6c3e8e5456c8f4951a0072fcb8d5b389e5'),
+]
+
+class RegisterCodecsTest(unittest.TestCase):
+
+  def test_registers_are_32_bits(self):
+    for bios_type, codecs in register_codecs.items():
+      for r_name, (offset, fields) in codecs.items():
+        bits=0
+        for name, shift, mask in fields:
+          self.assertEqual(bits & (mask << shift), 0, '%s %s overlaps' % (r_name, name))
+          bits|=mask << shift
+        self.assertEqual(bits, 0xffffffff, '%s %s does not cover 32 bits' % (bios_type, r_name))
+
+  def test_decode(self):
+    for bios_type, timing, dump in strap_vectors:
+      self.assertEqual(format_register_string(bios_type, bytearray(timing.decode('hex'))), dump)
+
+  def test_set(self):
+    straps=dict((bios_type, timing) for bios_type, timing, dump in reversed(strap_vectors))
+    for bios_type, name, eqop, value, expected in set_vectors:
+      timing=bytearray(straps[bios_type].decode('hex'))
+      self.assertEqual(hexify(set_register_in_string(bios_type, name, value, eqop, timing)), expected)
+
+  @unittest.skipIf(get_numpy() is None, 'NumPy is not installed')
+  def test_decode_columns(self):
+    for bios_type in register_codecs:
+      timings=[bytearray(timing.decode('hex')) for t, timing, dump in strap_vectors if t==bios_type]
+      columns=decode_columns(bios_type, strap_matrix(timings))
+      for i, timing in enumerate(timings):
+        for name, value in decode_fields(bios_type, timing):
+          self.assertEqual(columns[name][i], value, '%s %s' % (bios_type, name))
+
+if __name__ == '__main__':
+  unittest.main()
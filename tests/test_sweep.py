@@ -0,0 +1,75 @@
+import sys
+import os
+import shutil
+import tempfile
+import subprocess
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+from atom_timings_editor import BiosImage
+from atom_timings_sweep import expand_sweeps, run_sweep, validate_plans
+from synthetic_rom import make_bios
+
+#strap 0:100000 of the synthetic R9 bios keeps every rule, TRC=1 breaks TRCDR<=TRC and more
+
+sweep_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'atom_timings_sweep.py')
+
+class SweepValidationTest(unittest.TestCase):
+
+  def setUp(self):
+    self.dir=tempfile.mkdtemp()
+    self.image=BiosImage(make_bios('R9'))
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def sweep(self, sweeps):
+    return list(run_sweep(self.image, expand_sweeps(sweeps), os.path.join(self.dir, 'v%d.rom'), 1))
+
+  def test_base_patch_is_validated(self):
+    self.image.patch('0:100000=0:100000[TRC=1]')
+    self.assertTrue(self.image.validate())
+
+  def test_base_patch_is_not_the_original(self):
+    self.image.patch('0:100000=0:100000[TRC=1]')
+    results=self.sweep(['0:100000=0:100000[TCL=7/8/9]'])
+    self.assertEqual(len(results), 3)
+    for path, patches, message in results:
+      self.assertTrue(message is not None and message.startswith('Breaks timing rules'), message)
+      self.assertFalse(os.path.exists(path))
+
+  def test_plans_are_compared_with_the_loaded_table(self):
+    self.image.patch('0:100000=0:100000[TRC=1]')
+    plan=[(0, self.image.timing_table.timing(0))]
+    self.assertEqual(validate_plans(self.image.original_timing_table, [plan], 'R9').keys(), [0])
+    self.assertEqual(validate_plans(self.image.timing_table, [plan], 'R9'), {})
+
+  def test_variants_within_rules_are_written(self):
+    self.image.patch('0:100000=0:100000[TRC=1]')
+    results=self.sweep(['0:100000=0:100000[TRC=60/70]'])
+    self.assertEqual([message for path, patches, message in results], [None, None])
+    for path, patches, message in results:
+      self.assertTrue(os.path.exists(path))
+
+  def run_cli(self, *args):
+    bios_path=os.path.join(self.dir, 'bios.rom')
+    with open(bios_path, 'wb') as bios_file:
+      bios_file.write(make_bios('R9'))
+    output_dir=os.path.join(self.dir, 'variants')
+    with open(os.devnull, 'w') as null:
+      rc=subprocess.call([sys.executable, sweep_path, '-i', bios_path, '-d', output_dir, '-j', '1']+list(args), stderr=null)
+    return rc, sorted(f for f in os.listdir(output_dir) if f.endswith('.rom')) if os.path.isdir(output_dir) else []
+
+  def test_cli_refuses_base_patches_breaking_rules(self):
+    #the sweep does not touch the patched strap, so only the base patch check can catch it
+    rc, variants=self.run_cli('-p', '0:100000=0:100000[TRC=1]', '-s', '0:125000=0:125000[TCL=7/8/9]')
+    self.assertEqual(rc, 1)
+    self.assertEqual(variants, [])
+
+  def test_cli_force_writes_base_patches_breaking_rules(self):
+    rc, variants=self.run_cli('--force', '-p', '0:100000=0:100000[TRC=1]', '-s', '0:125000=0:125000[TCL=7/8/9]')
+    self.assertEqual(rc, 0)
+    self.assertEqual(len(variants), 3)
+
+if __name__ == '__main__':
+  unittest.main()
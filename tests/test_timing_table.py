@@ -0,0 +1,69 @@
+import sys
+import os
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks'))
+from atom_timing_table import TimingTable
+from atom_timings_editor import BiosImage
+from synthetic_rom import make_bios
+
+def make_table():
+  return TimingTable.from_entries([(100000, 0, 'a'*0x30), (125000, 0, 'b'*0x30), (100000, 1, 'c'*0x30)])
+
+class TimingTableTest(unittest.TestCase):
+
+  def test_entries(self):
+    table=make_table()
+    self.assertEqual(len(table), 3)
+    self.assertEqual(tuple(table[1]), (125000, 0, 'b'*0x30))
+    self.assertEqual(tuple(table[-1]), (100000, 1, 'c'*0x30))
+    self.assertRaises(IndexError, table.__getitem__, 3)
+    self.assertEqual(table.pack_entry(2)[0:4], '\xa0\x86\x01\x01')
+
+  def test_from_buffer(self):
+    table=make_table()
+    data='xx'+table.pack()
+    self.assertEqual(TimingTable.from_buffer(data, 2, 3).pack(), table.pack())
+    self.assertRaises(SystemExit, TimingTable.from_buffer, data, 2, 4)
+
+  def test_wrong_length(self):
+    table=make_table()
+    self.assertRaises(SystemExit, table.set_timing, 0, 'a'*0x20)
+    self.assertRaises(SystemExit, table.append, 150000, 0, 'a'*0x31)
+
+  def test_snapshot_is_isolated(self):
+    table=make_table()
+    snapshot=table.snapshot()
+    self.assertTrue(snapshot.timings is table.timings) #nothing copied before a write
+    table.set_timing(0, 'x'*0x30)
+    table.append(150000, 0, 'y'*0x30)
+    self.assertEqual(snapshot.timing(0), 'a'*0x30)
+    self.assertEqual(len(snapshot), 3)
+    self.assertEqual(table.timing(0), 'x'*0x30)
+
+  def test_snapshot_write_leaves_table(self):
+    table=make_table()
+    snapshot=table.snapshot()
+    snapshot.set_timing(1, 'z'*0x30)
+    self.assertEqual(table.timing(1), 'b'*0x30)
+    self.assertEqual(snapshot.timing(1), 'z'*0x30)
+
+  def test_snapshot_of_snapshot(self):
+    table=make_table()
+    a=table.snapshot()
+    b=a.snapshot()
+    a.set_timing(2, 'q'*0x30)
+    self.assertEqual(table.timing(2), 'c'*0x30)
+    self.assertEqual(b.timing(2), 'c'*0x30)
+
+  def test_image_copies_are_isolated(self):
+    image=BiosImage(make_bios('R9'))
+    original=image.timing_table.pack()
+    copy=image.copy()
+    copy.patch('0:100000=0:125000')
+    self.assertEqual(image.timing_table.pack(), original)
+    self.assertNotEqual(copy.timing_table.pack(), original)
+    self.assertEqual(image.patch_baselines, {})
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,61 @@
+import sys
+import os
+import random
+import unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from atom_rom_timings import get_numpy, register_cache, set_subregister
+import atom_timings_validate
+from atom_timings_validate import check_timings, validate_timings
+
+#the NumPy pass over many straps must report the same violations as the register cache one by one
+
+def random_timings(n, seed=0):
+  rnd=random.Random(seed)
+  return [bytes(bytearray(rnd.randrange(256) for i in xrange(0x30))) for j in xrange(n)]
+
+class ValidateTest(unittest.TestCase):
+
+  def setUp(self):
+    self.vectorize_min_timings=atom_timings_validate.vectorize_min_timings
+
+  def tearDown(self):
+    atom_timings_validate.vectorize_min_timings=self.vectorize_min_timings
+
+  def scalar(self, f, *args):
+    atom_timings_validate.vectorize_min_timings=sys.maxint
+    register_cache.clear()
+    try:
+      return f(*args)
+    finally:
+      atom_timings_validate.vectorize_min_timings=self.vectorize_min_timings
+
+  @unittest.skipIf(get_numpy() is None, 'NumPy is not installed')
+  def test_check_timings_agree(self):
+    for bios_type in ['R9', 'RX']:
+      timings=random_timings(self.vectorize_min_timings+44)
+      vectorized=check_timings(bios_type, timings)
+      self.assertEqual(vectorized, self.scalar(check_timings, bios_type, timings))
+      for r, ok in vectorized: #random straps must exercise both outcomes of every rule
+        self.assertTrue(True in ok and False in ok, r[0])
+
+  @unittest.skipIf(get_numpy() is None, 'NumPy is not installed')
+  def test_validate_timings_agree(self):
+    for bios_type in ['R9', 'RX']:
+      originals=random_timings(self.vectorize_min_timings, 1)
+      timings=[bytearray(s) for s in originals]
+      for s in timings:
+        set_subregister(bios_type, 'TRC', s, 30) #breaks the rules only on some straps
+      timings=map(bytes, timings)
+      for args in [(bios_type, timings), (bios_type, timings, originals)]:
+        violations=validate_timings(*args)
+        self.assertTrue(violations)
+        self.assertEqual(violations, self.scalar(validate_timings, *args))
+
+  def test_empty(self):
+    self.assertEqual(check_timings('R9', []), [(r, []) for r in atom_timings_validate.timing_rules])
+
+  def test_bios_type_required(self):
+    self.assertRaises(SystemExit, validate_timings, None, random_timings(1))
+
+if __name__ == '__main__':
+  unittest.main()